@@ -0,0 +1,55 @@
+# benchmarks/auth.py
+
+"""Per-request cost of token verification with and without the TokenCache.
+
+  python -m benchmarks.auth --requests 100000
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import jwt
+
+from token_cache import TokenCache
+
+SECRET_KEY = "benchmark-secret"
+
+
+def per_call_us(verify, token, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        verify(token)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def run(requests):
+    token = jwt.encode({
+        "user_id": "612a4b1c3b0b1c0b1c0b1c0b",
+        "exp": datetime.utcnow() + timedelta(hours=15)
+    }, SECRET_KEY, algorithm="HS256")
+    cache = TokenCache()
+
+    def decode(token):
+        return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+
+    def cached(token):
+        data = cache.get(token)
+        if data is None:
+            data = decode(token)
+            cache.put(token, data)
+        return data
+
+    return {
+        "jwt_decode_us": round(per_call_us(decode, token, requests), 3),
+        "cached_us": round(per_call_us(cached, token, requests), 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100000)
+    args = parser.parse_args()
+
+    for key, value in run(args.requests).items():
+        print(f"{key}: {value}")
@@ -0,0 +1,86 @@
+# benchmarks/login_burst.py
+
+"""Load test against a running backend: measures latency of a cheap protected
+route on its own and again while a burst of sign-ins hits the server.
+
+  python -m benchmarks.login_burst --url http://127.0.0.1:5000 \
+      --identifier johndoe --password password123 --burst 50
+"""
+
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+
+def request(url, data=None, token=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    body = json.dumps(data).encode() if data is not None else None
+    req = urllib.request.Request(url, data=body, headers=headers, method="POST" if body else "GET")
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    return status, payload, time.perf_counter() - started
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def probe(url, token, samples, stop=None):
+    latencies = []
+    while len(latencies) < samples and not (stop and stop.is_set()):
+        latencies.append(request(f"{url}/stats/aggregate", token=token)[2])
+    return latencies
+
+
+def run(url, identifier, password, burst, samples):
+    credentials = {"identifier": identifier, "password": password}
+    status, payload, _ = request(f"{url}/signin", credentials)
+    if status != 200:
+        raise SystemExit(f"Sign in failed ({status}): {payload.decode()}")
+    token = json.loads(payload)["token"]
+
+    baseline = probe(url, token, samples)
+
+    stop = Event()
+    with ThreadPoolExecutor(max_workers=burst + 1) as pool:
+        during = pool.submit(probe, url, token, samples, stop)
+        logins = list(pool.map(lambda _: request(f"{url}/signin", credentials), range(burst)))
+        stop.set()
+        during = during.result()
+
+    statuses = {}
+    for status, _, _ in logins:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    return {
+        "baseline_p50_ms": round(percentile(baseline, 0.5), 2),
+        "baseline_p99_ms": round(percentile(baseline, 0.99), 2),
+        "burst_p50_ms": round(percentile(during, 0.5), 2),
+        "burst_p99_ms": round(percentile(during, 0.99), 2),
+        "login_p99_ms": round(percentile([latency for _, _, latency in logins], 0.99), 2),
+        "login_statuses": statuses,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--identifier", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--burst", type=int, default=50, help="concurrent sign-ins")
+    parser.add_argument("--samples", type=int, default=200, help="probe requests per phase")
+    args = parser.parse_args()
+
+    for key, value in run(args.url, args.identifier, args.password, args.burst, args.samples).items():
+        print(f"{key}: {value}")
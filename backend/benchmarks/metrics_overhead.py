@@ -0,0 +1,69 @@
+# benchmarks/metrics_overhead.py
+
+"""Cost of recording one metric sample on the send path (a histogram observe
+or a counter inc, measured as alternating pairs), from one thread and from
+several at once, and the time to render a scrape. Fails when a sample costs
+more than --budget-ns.
+
+  python -m benchmarks.metrics_overhead --samples 1000000 --threads 8
+"""
+
+import argparse
+import sys
+import time
+from threading import Thread
+
+from metrics import MetricsRegistry
+
+
+def record(histogram, counter, samples, pairs):
+    labels = [(("send", f"pair-{i}", ""), (f"pair-{i}", "", "sent")) for i in range(pairs)]
+    labels = labels * (samples // 2 // pairs) + labels[:samples // 2 % pairs]
+    observe, inc = histogram.observe, counter.inc
+    for stage, result in labels:
+        observe(stage, 0.003)
+        inc(result)
+
+
+def run(samples, threads, pairs):
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "benchmark", ("stage", "pair", "proxy"))
+    counter = registry.counter("bench_total", "benchmark", ("pair", "proxy", "result"))
+
+    started = time.perf_counter()
+    record(histogram, counter, samples, pairs)
+    single = time.perf_counter() - started
+
+    workers = [Thread(target=record, args=(histogram, counter, samples // threads, pairs)) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    threaded = time.perf_counter() - started
+
+    started = time.perf_counter()
+    text = registry.render()
+    rendered = time.perf_counter() - started
+
+    return {
+        "single_thread_ns_per_sample": round(single / samples * 1e9, 1),
+        f"{threads}_threads_ns_per_sample": round(threaded / (samples // threads * threads) * 1e9, 1),
+        "render_ms": round(rendered * 1000, 2),
+        "render_bytes": len(text),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=1000000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pairs", type=int, default=50, help="distinct pair labels")
+    parser.add_argument("--budget-ns", type=float, default=1000,
+                        help="allowed cost of one sample from a single thread")
+    args = parser.parse_args()
+
+    result = run(args.samples, args.threads, args.pairs)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    sys.exit(1 if result["single_thread_ns_per_sample"] > args.budget_ns else 0)
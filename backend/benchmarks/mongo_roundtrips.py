@@ -0,0 +1,83 @@
+# benchmarks/mongo_roundtrips.py
+
+"""Counts the MongoDB operations each user/pair CRUD route performs against an
+in-process Mongo stand-in and fails when a route exceeds its budget.
+
+  python -m benchmarks.mongo_roundtrips
+"""
+
+import io
+import sys
+from datetime import datetime, timedelta
+
+from benchmarks.stubs import CountingCollection, install_stub_databases
+
+# Round trips allowed on the users/pairs collections per request
+BUDGETS = {
+    "POST /user": 1,
+    "POST /user (duplicate)": 1,
+    "POST /program/create": 1,
+    "POST /program/create (duplicate)": 1,
+    "PATCH /program/update": 1,
+}
+
+
+def run():
+    install_stub_databases()
+
+    import jwt
+    import main
+    from indexes import ensure_indexes
+    from models import MongoPair, User
+
+    ensure_indexes()
+    users = User.collection = CountingCollection(User.collection)
+    pairs = MongoPair.collection = CountingCollection(MongoPair.collection)
+
+    token = jwt.encode(
+        {"user_id": "bench", "exp": datetime.utcnow() + timedelta(hours=1)},
+        main.SECRET_KEY, algorithm="HS256"
+    )
+    client = main.app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def create_pair():
+        return client.post("/program/create", headers=headers, data={
+            "pair_name": "bench pair",
+            "proxy": "127.0.0.1:3128",
+            "number_list": (io.BytesIO(b"+919876543210\n"), "numbers.txt"),
+        })
+
+    pair_id = None
+
+    def update_pair():
+        return client.patch(f"/program/update/{pair_id}", headers=headers, json={"priority": 3})
+
+    results = {}
+    for label, call in [
+        ("POST /user", lambda: client.post("/user", json={
+            "username": "bench", "password": "bench", "email": "bench@example.com"})),
+        ("POST /user (duplicate)", lambda: client.post("/user", json={
+            "username": "bench", "password": "bench", "email": "other@example.com"})),
+        ("POST /program/create", create_pair),
+        ("POST /program/create (duplicate)", create_pair),
+        ("PATCH /program/update", update_pair),
+    ]:
+        users.reset()
+        pairs.reset()
+        response = call()
+        if label == "POST /program/create":
+            pair_id = response.get_json()["pair_id"]
+        results[label] = (response.status_code, users.total + pairs.total)
+
+    return results
+
+
+if __name__ == "__main__":
+    failed = False
+    for label, (status, round_trips) in run().items():
+        over = round_trips > BUDGETS[label]
+        failed = failed or over
+        print(f"{label}: status={status} round_trips={round_trips} budget={BUDGETS[label]}"
+              f"{'  OVER BUDGET' if over else ''}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,146 @@
+# benchmarks/multi_instance.py
+
+"""Runs several backend instances with SMS_COORDINATION=true against the MongoDB
+and SQL databases from .env and a local stub gateway, then reports how the
+pairs were spread over the instances and whether any pair went over its rate
+limit. Midway through, one instance is killed to show its pairs being taken
+over once their leases expire.
+
+  python -m benchmarks.multi_instance --instances 3 --pairs 12 --seconds 60
+
+The benchmark creates pairs named bench-<n> and removes them afterwards.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from benchmarks.stub_gateway import StubGateway
+
+PREFIX = "bench-"
+
+
+def seed(count, numbers, rate_limit, directory):
+    from models import MongoPair
+
+    cleanup()
+    for i in range(count):
+        path = os.path.join(directory, f"{PREFIX}{i}.txt")
+        with open(path, "w") as f:
+            f.writelines(f"+1{i:03d}{n:07d}\n" for n in range(numbers))
+        MongoPair.collection.insert_one({
+            "pair_name": f"{PREFIX}{i}",
+            "proxy": None,
+            "priority": i % 3,
+            "rate_limit": rate_limit,
+            "active_status": True,
+            "session_details": {"numbers_file": path},
+        })
+
+
+def cleanup():
+    from models import MongoPair
+    from coordination import LeaseManager
+    from checkpoints import ProgressCheckpoint
+
+    names = {"$regex": f"^{PREFIX}"}
+    MongoPair.collection.delete_many({"pair_name": names})
+    LeaseManager.leases.delete_many({"_id": names})
+    ProgressCheckpoint.collection.delete_many({"_id": names})
+
+
+def owners():
+    from coordination import LeaseManager
+
+    now = time.time()
+    return Counter(
+        doc["owner"] for doc in LeaseManager.leases.find({"_id": {"$regex": f"^{PREFIX}"}})
+        if doc["expires_at"].timestamp() > now
+    )
+
+
+def worst_window(times, period=60.0):
+    """Most sends inside any `period` seconds"""
+    times = sorted(times)
+    worst = start = 0
+    for end, t in enumerate(times):
+        while t - times[start] >= period:
+            start += 1
+        worst = max(worst, end - start + 1)
+    return worst
+
+
+def run_instance(seconds):
+    from service import SMSService
+
+    SMSService.coordinator.start()
+    time.sleep(seconds)
+
+
+def run(instances, pairs, numbers, rate_limit, seconds, ttl):
+    gateway = StubGateway().start()
+    env = dict(
+        os.environ,
+        SMS_GATEWAY_URL=gateway.url,
+        SMS_COORDINATION="true",
+        SMS_LEASE_TTL=str(ttl),
+    )
+
+    seed(pairs, numbers, rate_limit, tempfile.mkdtemp(prefix="sms-bench-"))
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.multi_instance", "--instance", "--seconds", str(seconds)],
+            env=env
+        )
+        for _ in range(instances)
+    ]
+
+    time.sleep(seconds / 2)
+    before_kill = owners()
+    processes[0].kill()
+    time.sleep(ttl * 2)
+    after_kill = owners()
+    for process in processes[1:]:
+        process.wait()
+
+    per_pair = defaultdict(list)
+    for sent_at, phone_number in gateway.sent:
+        per_pair[int(phone_number[2:5])].append(sent_at)
+    cleanup()
+    gateway.shutdown()
+
+    allowed = rate_limit * (seconds / 60.0) + 1  # the first send goes out right away
+    worst = {pair: worst_window(times) for pair, times in per_pair.items()}
+    return {
+        "pairs per instance (all running)": sorted(before_kill.values()),
+        "pairs per instance (one killed)": sorted(after_kill.values()),
+        "pairs that sent": len(per_pair),
+        "total sends": len(gateway.sent),
+        "most sends by one pair": max((len(t) for t in per_pair.values()), default=0),
+        "allowed per pair": int(allowed),
+        "worst 60s window": max(worst.values(), default=0),
+        "rate limit": rate_limit,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", type=int, default=3)
+    parser.add_argument("--pairs", type=int, default=12)
+    parser.add_argument("--numbers", type=int, default=1000)
+    parser.add_argument("--rate-limit", type=int, default=60, help="SMS per minute per pair")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--ttl", type=float, default=6, help="lease TTL in seconds")
+    parser.add_argument("--instance", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.instance:
+        run_instance(args.seconds)
+    else:
+        result = run(args.instances, args.pairs, args.numbers, args.rate_limit, args.seconds, args.ttl)
+        for key, value in result.items():
+            print(f"{key}: {value}")
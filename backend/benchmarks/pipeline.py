@@ -0,0 +1,154 @@
+# benchmarks/pipeline.py
+
+"""Drives SMSService end to end: N pairs x M numbers are uploaded, started and
+sent through the scheduler, send engine and stats writer to a local stub
+gateway, against mongomock (or a local mongod with --mongo-url) and sqlite.
+Reports sends/sec, per-send latency, database round trips per send and
+memory. With --baseline it fails when throughput or round trips regress.
+
+  python -m benchmarks.pipeline --pairs 20 --numbers 2000 --latency 0.02
+  python -m benchmarks.pipeline --save baseline.json
+  python -m benchmarks.pipeline --baseline baseline.json
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from benchmarks.stub_gateway import StubGateway
+from benchmarks.stubs import CountingCollection, install_stub_databases
+
+# Allowed change against a baseline before the run counts as a regression
+THROUGHPUT_TOLERANCE = 0.8   # at least 80% of the baseline sends/sec
+ROUND_TRIP_TOLERANCE = 1.25  # at most 125% of the baseline round trips per send
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(pairs, numbers, latency, error_rate, mongo_url=None, trace_memory=False):
+    gateway = StubGateway(latency=latency, error_rate=error_rate).start()
+    os.environ["SMS_GATEWAY_URL"] = gateway.url
+    os.environ.setdefault("SMS_RATE_LIMIT_PER_MINUTE", "100000000")
+    app = install_stub_databases(mongo_url=mongo_url)
+
+    from sqlalchemy import event
+
+    from checkpoints import ProgressCheckpoint
+    from config import db_SQL
+    from models import MongoPair
+    from service import SMSService
+
+    for i in range(pairs):
+        content = "".join(f"+1{i:04d}{n:06d}\n" for n in range(numbers)).encode()
+        MongoPair.insert_one(
+            pair_name=f"bench-{i}",
+            active_status=False,
+            priority=i % 3,
+            session_details={},
+            proxy=None,
+            number_list_file={"filename": "numbers.txt", "stream": io.BytesIO(content), "content_type": "text/plain"}
+        )
+
+    # Count database work from here on
+    counted = [MongoPair, ProgressCheckpoint]
+    for owner in counted:
+        owner.collection = CountingCollection(owner.collection)
+    sql_statements = [0]
+    with app.app_context():
+        event.listen(db_SQL.engine, "before_cursor_execute",
+                     lambda *args: sql_statements.__setitem__(0, sql_statements[0] + 1))
+
+    latencies = []
+    engine_submit = SMSService.send_engine.submit
+
+    def timed_submit(*args):
+        started = time.perf_counter()
+        future = engine_submit(*args)
+        future.add_done_callback(lambda _: latencies.append(time.perf_counter() - started))
+        return future
+    SMSService.send_engine.submit = timed_submit
+
+    if trace_memory:
+        tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    for i in range(pairs):
+        SMSService.start_pair(f"bench-{i}")
+    while SMSService.running_pairs:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    SMSService.stats.flush()
+
+    traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    gateway.shutdown()
+
+    sends = len(latencies)
+    mongo_ops = sum(owner.collection.total for owner in counted)
+    result = {
+        "pairs": pairs,
+        "numbers_per_pair": numbers,
+        "sends": sends,
+        "seconds": round(elapsed, 3),
+        "sends_per_second": round(sends / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mongo_ops_per_send": round(mongo_ops / max(sends, 1), 4),
+        "sql_statements_per_send": round(sql_statements[0] / max(sends, 1), 4),
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        "peak_rss_growth_mb": round((rss_after - rss_before) / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+    }
+    if traced_peak is not None:
+        result["traced_peak_mb"] = round(traced_peak / 1024 / 1024, 1)
+    return result
+
+
+def regressions(result, baseline):
+    """Descriptions of every metric that is worse than `baseline` allows"""
+    found = []
+    if result["sends_per_second"] < baseline["sends_per_second"] * THROUGHPUT_TOLERANCE:
+        found.append(f"sends_per_second {result['sends_per_second']} < {baseline['sends_per_second']}")
+    for key in ("mongo_ops_per_send", "sql_statements_per_send"):
+        if result[key] > baseline[key] * ROUND_TRIP_TOLERANCE + 0.001:
+            found.append(f"{key} {result[key]} > {baseline[key]}")
+    if result["sends"] != baseline["sends"]:
+        found.append(f"sends {result['sends']} != {baseline['sends']}")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=10)
+    parser.add_argument("--numbers", type=int, default=1000, help="numbers per pair")
+    parser.add_argument("--latency", type=float, default=0.01, help="stub gateway latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--mongo-url", help="use this mongod instead of mongomock")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (several times slower, do not compare with a baseline)")
+    parser.add_argument("--save", help="write the result as JSON to this file, e.g. as a baseline")
+    parser.add_argument("--baseline", help="JSON result of an earlier run to compare against")
+    args = parser.parse_args()
+
+    result = run(args.pairs, args.numbers, args.latency, args.error_rate, args.mongo_url, args.trace_memory)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(result, json.load(f))
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
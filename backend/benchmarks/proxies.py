@@ -0,0 +1,109 @@
+# benchmarks/proxies.py
+
+"""Sends through three kinds of proxy at once for a fixed time: healthy, slow
+(answers after the send timeout) and dead (refuses connections), each used
+by the same number of pairs, on mongomock + sqlite. Reports per proxy the
+sends attempted, delivered and failed and where its adaptive controller
+ended up. Run it with and without --no-control to compare.
+
+  python -m benchmarks.proxies --pairs 3 --seconds 20
+  python -m benchmarks.proxies --pairs 3 --seconds 20 --no-control
+"""
+
+import argparse
+import io
+import os
+import socket
+import time
+
+from benchmarks.stub_gateway import StubGateway
+
+
+def closed_port():
+    """A local port nothing listens on"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(pairs, numbers, seconds, latency, timeout, control=True):
+    gateway = StubGateway(latency=latency).start()
+    healthy = StubGateway(latency=latency).start()
+    slow = StubGateway(latency=timeout * 3).start()
+    proxies = {
+        "healthy": f"127.0.0.1:{healthy.server_address[1]}",
+        "slow": f"127.0.0.1:{slow.server_address[1]}",
+        "dead": f"127.0.0.1:{closed_port()}",
+    }
+    os.environ["SMS_GATEWAY_URL"] = gateway.url
+    os.environ["SMS_SEND_TIMEOUT"] = str(timeout)
+    os.environ.setdefault("SMS_RATE_LIMIT_PER_MINUTE", "100000000")
+
+    from benchmarks.stubs import install_stub_databases
+    install_stub_databases()
+
+    from metrics import errors_total, results_total
+    from models import MongoPair
+    from service import SMSService
+
+    SMSService.proxies.enabled = control
+    SMSService.stop_timeout = timeout
+    for kind, proxy in proxies.items():
+        for i in range(pairs):
+            content = "".join(f"+1{i:04d}{n:06d}\n" for n in range(numbers)).encode()
+            MongoPair.insert_one(
+                pair_name=f"bench-{kind}-{i}",
+                active_status=False,
+                priority=0,
+                session_details={},
+                proxy=proxy,
+                number_list_file={"filename": "numbers.txt", "stream": io.BytesIO(content), "content_type": "text/plain"}
+            )
+
+    started = time.perf_counter()
+    for kind in proxies:
+        for i in range(pairs):
+            SMSService.start_pair(f"bench-{kind}-{i}")
+    time.sleep(seconds)
+    for pair_name in list(SMSService.running_pairs):
+        SMSService.stop_local(pair_name, wait=False)
+    elapsed = time.perf_counter() - started
+
+    results = results_total.collect()
+    errors = errors_total.collect()
+    controllers = SMSService.proxies.snapshot()
+    report = {}
+    for kind, proxy in proxies.items():
+        sent = sum(v for (_, p, result), v in results.items() if p == proxy and result == "sent")
+        failed = sum(v for (_, p, result), v in results.items() if p == proxy and result == "failed")
+        causes = {}
+        for (_, p, cause), v in errors.items():
+            if p == proxy:
+                causes[cause] = causes.get(cause, 0) + v
+        report[kind] = {
+            "attempted": sent + failed,
+            "sent": sent,
+            "failed": failed,
+            "sent_per_second": round(sent / elapsed, 1),
+            "errors": causes,
+            "controller": controllers.get(proxy),
+        }
+
+    for server in (gateway, healthy, slow):
+        server.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=3, help="pairs per proxy")
+    parser.add_argument("--numbers", type=int, default=100000, help="numbers per pair")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--latency", type=float, default=0.01, help="gateway and healthy proxy latency in seconds")
+    parser.add_argument("--timeout", type=float, default=1.0, help="send timeout in seconds")
+    parser.add_argument("--no-control", action="store_true", help="send without the adaptive proxy controllers")
+    args = parser.parse_args()
+
+    report = run(args.pairs, args.numbers, args.seconds, args.latency, args.timeout, not args.no_control)
+    for kind, row in report.items():
+        print(f"{kind}: {row}")
@@ -0,0 +1,92 @@
+# benchmarks/proxy_pool.py
+
+"""Sends one pair's list through pools of 1, 2, ... --proxies stub proxies
+(each capped at --per-proxy sends in flight) on mongomock + sqlite, and
+reports sends/sec per pool size. Checks that every number was sent exactly
+once across the proxies and that the pair's checkpoint completed.
+
+  python -m benchmarks.proxy_pool --proxies 4 --numbers 4000 --latency 0.05
+  python -m benchmarks.proxy_pool --proxies 4 --routing weighted
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from collections import Counter
+
+from benchmarks.stub_gateway import StubGateway
+
+
+def run(max_proxies, numbers, latency, per_proxy, routing):
+    os.environ["SMS_PROXY_MAX_CONCURRENCY"] = str(per_proxy)
+    os.environ["SMS_PAIR_CONCURRENCY"] = str(per_proxy)
+    os.environ.setdefault("SMS_RATE_LIMIT_PER_MINUTE", "100000000")
+    gateway = StubGateway().start()
+    os.environ["SMS_GATEWAY_URL"] = gateway.url
+    stubs = [StubGateway(latency=latency).start() for _ in range(max_proxies)]
+
+    from benchmarks.stubs import install_stub_databases
+    install_stub_databases()
+
+    from checkpoints import ProgressCheckpoint
+    from models import MongoPair
+    from service import SMSService
+
+    results = []
+    sizes = sorted({1, max(1, max_proxies // 2), max_proxies})
+    for size in sizes:
+        pool = stubs[:size]
+        for stub in pool:
+            stub.sent = []
+        pair_name = f"bench-pool-{size}"
+        content = "".join(f"+1555{n:07d}\n" for n in range(numbers)).encode()
+        MongoPair.insert_one(
+            pair_name=pair_name,
+            active_status=False,
+            priority=0,
+            session_details={},
+            proxy=None,
+            number_list_file={"filename": "numbers.txt", "stream": io.BytesIO(content), "content_type": "text/plain"},
+            proxies=MongoPair.parse_proxies([f"127.0.0.1:{stub.server_address[1]}" for stub in pool]),
+            proxy_routing=routing
+        )
+
+        started = time.perf_counter()
+        SMSService.start_pair(pair_name)
+        while SMSService.running_pairs:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+        sent = Counter(phone for stub in pool for _, phone in stub.sent)
+        checkpoint = ProgressCheckpoint.collection.find_one({"_id": pair_name}) or {}
+        results.append({
+            "proxies": size,
+            "seconds": round(elapsed, 3),
+            "sends_per_second": round(sum(sent.values()) / elapsed, 1),
+            "per_proxy": [len(stub.sent) for stub in pool],
+            "unique": len(sent),
+            "duplicates": sum(sent.values()) - len(sent),
+            "checkpoint_completed": bool(checkpoint.get("completed")),
+        })
+
+    for stub in stubs + [gateway]:
+        stub.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--proxies", type=int, default=4, help="largest pool size")
+    parser.add_argument("--numbers", type=int, default=4000)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub proxy latency in seconds")
+    parser.add_argument("--per-proxy", type=int, default=8, help="sends in flight allowed per proxy")
+    parser.add_argument("--routing", choices=("least_loaded", "weighted"), default="least_loaded")
+    args = parser.parse_args()
+
+    results = run(args.proxies, args.numbers, args.latency, args.per_proxy, args.routing)
+    for row in results:
+        print(row)
+    failed = any(row["unique"] != args.numbers or row["duplicates"] or not row["checkpoint_completed"] for row in results)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,56 @@
+# benchmarks/send_engine.py
+
+"""Measures sustained sends per second of SendEngine against a local stub gateway.
+
+  python -m benchmarks.send_engine --count 5000 --concurrency 64 --latency 0.02
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from benchmarks.stub_gateway import StubGateway
+
+
+def run(count, concurrency, latency, error_rate):
+    gateway = StubGateway(latency=latency, error_rate=error_rate).start()
+    os.environ["SMS_GATEWAY_URL"] = gateway.url
+
+    from send_engine import SendEngine
+
+    engine = SendEngine(connections_per_proxy=concurrency)
+    engine.start()
+
+    pending = set()
+    sent = 0
+    started = time.perf_counter()
+    for i in range(count):
+        if len(pending) >= concurrency:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            sent += sum(1 for f in done if f.result()[0])
+        pending.add(engine.submit(f"+1555{i:07d}", None))
+    done, _ = wait(pending)
+    sent += sum(1 for f in done if f.result()[0])
+    elapsed = time.perf_counter() - started
+
+    engine.stop()
+    gateway.shutdown()
+    return {
+        "numbers": count,
+        "sent": sent,
+        "seconds": round(elapsed, 3),
+        "sends_per_second": round(count / elapsed, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.01, help="stub gateway latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    for key, value in run(args.count, args.concurrency, args.latency, args.error_rate).items():
+        print(f"{key}: {value}")
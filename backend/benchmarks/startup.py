@@ -0,0 +1,74 @@
+# benchmarks/startup.py
+
+"""Measures the cold import time of the API module (main.py) in fresh
+interpreters. Each run imports the third-party floor (Flask, SQLAlchemy,
+pymongo, ...) first and then times `import main` on top of it in the same
+process, so the budget applies to the backend's own modules only. Also checks
+that importing opens no database connection (counted with audit hooks: socket
+connects for MongoDB, sqlite3 connects for the SQL stand-in).
+
+  python -m benchmarks.startup --runs 10 --budget-ms 100
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# What the backend cannot avoid importing
+THIRD_PARTY = "flask, flask_sqlalchemy, flask_cors, pymongo, gridfs, jwt, bcrypt, dotenv"
+
+PROBE = """
+import sys, time
+connects = []
+sys.addaudithook(lambda event, args: connects.append(event) if event in ("socket.connect", "sqlite3.connect") else None)
+started = time.perf_counter()
+import {third_party}
+preloaded = time.perf_counter()
+import main
+finished = time.perf_counter()
+print(round((preloaded - started) * 1000, 2), round((finished - preloaded) * 1000, 2), len(connects))
+"""
+
+
+def run(runs):
+    """Median import times (ms) over `runs` fresh interpreters, and the most connections seen"""
+    env = dict(
+        os.environ,
+        SQL_DATABASE_URL=f"sqlite:///{tempfile.gettempdir()}/sms-startup-bench.sqlite",
+        MONGODB_DATABASE_URL="mongodb://127.0.0.1:1/bench",
+        JWT_SECRET_KEY="benchmark-secret",
+    )
+    floors, own, totals, connects = [], [], [], 0
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(third_party=THIRD_PARTY)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout.split()
+        floors.append(float(output[-3]))
+        own.append(float(output[-2]))
+        totals.append(float(output[-3]) + float(output[-2]))
+        connects = max(connects, int(output[-1]))
+    return {
+        "third_party_import_ms": statistics.median(floors),
+        "main_import_ms": round(statistics.median(totals), 2),
+        "backend_own_import_ms": statistics.median(own),
+        "connections_at_import": connects,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=100,
+                        help="allowed time of `import main` once the third-party modules are loaded")
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+    failed = result["connections_at_import"] or result["backend_own_import_ms"] > args.budget_ms
+    sys.exit(1 if failed else 0)
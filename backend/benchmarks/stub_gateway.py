@@ -0,0 +1,67 @@
+# benchmarks/stub_gateway.py
+
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlsplit
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        gateway = self.server
+        if gateway.latency:
+            time.sleep(gateway.latency)
+
+        if random.random() < gateway.error_rate:
+            body = b"gateway error"
+        elif urlsplit(self.path).path == "/send":  # absolute URL when used as a proxy
+            gateway.sent.append((time.time(), payload.get("phone_number")))
+            body = b"sent successfully"
+        else:
+            body = b"submitted successfully"
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGateway(ThreadingHTTPServer):
+    """Local stand-in for the SMS gateway with configurable latency and error rate.
+
+    It also answers requests sent to it as an HTTP proxy, so several stubs can
+    stand in for proxies of different quality in front of the gateway.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, error_rate=0.0, port=0):
+        super().__init__(("127.0.0.1", port), StubGatewayHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sent = []  # (wall time, phone_number) of every successful /send
+
+    def handle_error(self, request, client_address):
+        pass  # clients that gave up on a slow answer
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        thread = Thread(target=self.serve_forever, name="stub-gateway")
+        thread.daemon = True
+        thread.start()
+        return self
@@ -0,0 +1,68 @@
+# benchmarks/stubs.py
+
+import os
+import tempfile
+
+# Collection methods that each cost one round trip to the server
+MONGO_OPERATIONS = {
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "delete_one", "delete_many", "find_one_and_update", "find_one_and_delete",
+    "count_documents", "aggregate", "bulk_write", "replace_one",
+}
+
+
+def install_stub_databases(sql_url=None, mongo_url=None):
+    """Point config at an in-process Mongo (mongomock) and a sqlite database.
+
+    With `mongo_url` a real (local) mongod is used instead of mongomock.
+    Must run before anything imports config. Returns the Flask app with the
+    SQL tables created.
+    """
+    if sql_url is None:
+        sql_url = f"sqlite:///{tempfile.mkdtemp(prefix='sms-bench-')}/stats.sqlite"
+    os.environ["SQL_DATABASE_URL"] = sql_url
+    os.environ["MONGODB_DATABASE_URL"] = mongo_url or "mongodb://localhost/sms_benchmark"
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+
+    if mongo_url is None:
+        import mongomock
+        import mongomock.gridfs
+        import pymongo
+
+        pymongo.MongoClient = mongomock.MongoClient
+        mongomock.gridfs.enable_gridfs_integration()
+
+    from config import app, db_SQL
+    import models  # registers the tables
+
+    with app.app_context():
+        db_SQL.create_all()
+    return app
+
+
+class CountingCollection:
+    """Wraps a collection and counts the operations sent through it"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.operations = {}
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name not in MONGO_OPERATIONS:
+            return attribute
+
+        def counted(*args, **kwargs):
+            self.operations[name] = self.operations.get(name, 0) + 1
+            return attribute(*args, **kwargs)
+        return counted
+
+    def __getitem__(self, name):
+        return self._collection[name]
+
+    @property
+    def total(self):
+        return sum(self.operations.values())
+
+    def reset(self):
+        self.operations = {}
@@ -0,0 +1,129 @@
+# checkpoints.py
+
+import itertools
+import os
+import time
+import zlib
+from datetime import datetime
+from threading import Lock
+
+from pymongo.errors import DuplicateKeyError
+
+from config import db_mongo
+from metrics import stage_seconds
+
+
+class ProgressCheckpoint:
+    """How far a pair has got through its number list.
+
+    `offset` counts the numbers from the start of the list whose sends have
+    all completed, and `fingerprint` is a CRC32 over exactly those numbers.
+    Sends complete out of order, so results past a gap are held until the gap
+    closes. The checkpoint is written every `batch_size` numbers or
+    `interval` seconds, so a crash re-sends at most one batch.
+
+    With coordination, `epoch` is the pair's lease epoch: a write is only
+    applied while no later lease owner has written, so an instance that lost
+    the pair can not move the new owner's offset back.
+    """
+
+    collection = db_mongo["pair_progress"]
+
+    def __init__(self, pair_name, file_id, batch_size=None, interval=None):
+        self.pair_name = pair_name
+        self.file_id = file_id
+        self.batch_size = batch_size or int(os.getenv("SMS_CHECKPOINT_BATCH", "100"))
+        self.interval = interval or float(os.getenv("SMS_CHECKPOINT_INTERVAL", "5"))
+        self.offset = 0
+        self.fingerprint = 0
+        self.epoch = None
+        self._completed = {}  # index -> number, for sends finished past the offset
+        self._saved_offset = 0
+        self._saved_at = time.monotonic()
+        self._retry_at = 0.0  # after a failed write, no new attempt before this time
+        self._lock = Lock()
+
+    def load(self):
+        """Restore the last saved position; returns the offset to resume from"""
+        doc = self.collection.find_one({"_id": self.pair_name})
+        if doc and doc.get("file_id") == self.file_id and not doc.get("completed"):
+            self.offset = self._saved_offset = doc["offset"]
+            self.fingerprint = doc["fingerprint"]
+        return self.offset
+
+    def skip(self, numbers):
+        """Advance the iterator past the saved offset.
+
+        Returns False (and resets the checkpoint) when the numbers read do
+        not match the saved fingerprint, meaning the list has changed.
+        """
+        fingerprint = 0
+        skipped = 0
+        for number in itertools.islice(numbers, self.offset):
+            fingerprint = _crc(number, fingerprint)
+            skipped += 1
+        if skipped == self.offset and fingerprint == self.fingerprint:
+            return True
+
+        self.offset = self._saved_offset = self.fingerprint = 0
+        return False
+
+    def complete(self, index, number):
+        """Record that the send of the number at `index` has finished"""
+        with self._lock:
+            self._completed[index] = number
+            while self.offset in self._completed:
+                self.fingerprint = _crc(self._completed.pop(self.offset), self.fingerprint)
+                self.offset += 1
+
+    def save_if_due(self):
+        """Write the checkpoint when a batch is full or the interval passed.
+
+        A failed write is only logged: the pair keeps sending and the write is
+        retried with the next batch, once `interval` seconds have passed.
+        """
+        if self.offset == self._saved_offset:
+            return
+        now = time.monotonic()
+        if now < self._retry_at:
+            return
+        if (self.offset - self._saved_offset >= self.batch_size
+                or now - self._saved_at >= self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Failed to checkpoint {self.pair_name}, retrying later: {e}")
+                self._retry_at = now + self.interval
+
+    def save(self, completed=False):
+        started = time.perf_counter()
+        with self._lock:
+            offset, fingerprint = self.offset, self.fingerprint
+        query = {"_id": self.pair_name}
+        fields = {
+            "file_id": self.file_id,
+            "offset": offset,
+            "fingerprint": fingerprint,
+            "completed": completed,
+            "updated_at": datetime.utcnow()
+        }
+        if self.epoch is not None:
+            query["$or"] = [{"epoch": {"$lte": self.epoch}}, {"epoch": {"$exists": False}}]
+            fields["epoch"] = self.epoch
+        try:
+            self.collection.update_one(query, {"$set": fields}, upsert=True)
+        except DuplicateKeyError:
+            # The filter missed an existing document: a later lease owner has written it
+            print(f"Not saving progress of {self.pair_name}, the pair has a newer owner")
+            return
+        self._saved_offset = offset
+        self._saved_at = time.monotonic()
+        stage_seconds.observe(("checkpoint_save", self.pair_name, ""), time.perf_counter() - started)
+
+    @classmethod
+    def delete(cls, pair_name):
+        cls.collection.delete_one({"_id": pair_name})
+
+
+def _crc(number, value):
+    return zlib.crc32(f"{number}\n".encode(), value)
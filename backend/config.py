@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from pool_metrics import MongoPoolMetrics, SQLPoolMetrics
 import os
 
 load_dotenv()
@@ -11,27 +12,85 @@ load_dotenv()
 SQL = os.getenv("SQL_DATABASE_URL")
 MONGODB = os.getenv("MONGODB_DATABASE_URL")
 
+# Pools are sized for the threads that use them at once: the dispatch
+# workers and coordinator (MongoDB), the stats writer (MySQL) and request
+# threads (both)
+WORKERS = int(os.getenv("SMS_WORKER_COUNT", "8"))
+API_THREADS = int(os.getenv("API_THREADS", "8"))
+
+sql_pool_metrics = SQLPoolMetrics()
+mongo_pool_metrics = MongoPoolMetrics()
+
+
+def sql_engine_options(url):
+    """Pool settings for the SQL engine; sqlite keeps SQLAlchemy's defaults"""
+    if not url or url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("SQL_POOL_SIZE", str(API_THREADS + 2))),
+        "max_overflow": int(os.getenv("SQL_MAX_OVERFLOW", str(API_THREADS))),
+        "pool_timeout": float(os.getenv("SQL_POOL_TIMEOUT", "10")),
+        "pool_recycle": int(os.getenv("SQL_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("SQL_POOL_PRE_PING", "true").lower() == "true",
+    }
+
+
+def mongo_pool_options():
+    max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", str(WORKERS + API_THREADS + 4)))
+    return {
+        "maxPoolSize": max_pool_size,
+        "minPoolSize": min(int(os.getenv("MONGO_MIN_POOL_SIZE", str(WORKERS))), max_pool_size),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+    }
+
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor"])
 
-# MySQL Database Configuration
+# MySQL Database Configuration (the engine connects on first use)
 try:
     app.config["SQLALCHEMY_DATABASE_URI"] = SQL
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = sql_engine_options(SQL)
     db_SQL = SQLAlchemy(app)
     with app.app_context():
-        db_SQL.engine.connect()
-    print("MySQL connected")
+        sql_pool_metrics.attach(db_SQL.engine)
 except Exception as e:
-    print(f"MySQL connection error: {e}")
+    print(f"MySQL configuration error: {e}")
 
-# MongoDB Database Configuration
+# MongoDB Database Configuration (the client connects on first use)
 try:
-    mongo_client = MongoClient(MONGODB)
+    mongo_client = MongoClient(
+        MONGODB,
+        connect=False,
+        event_listeners=[mongo_pool_metrics],
+        **mongo_pool_options()
+    )
     db_mongo = mongo_client.get_database()  # Access the MongoDB database instance
-    print("MongoDB connected")
 except Exception as e:
-    print(f"MongoDB connection error: {e}")
+    print(f"MongoDB configuration error: {e}")
+
+
+def check_connections():
+    """Connect to both databases once, e.g. when the server starts; returns True if both answered"""
+    ok = True
+    try:
+        with app.app_context():
+            with db_SQL.engine.connect():
+                pass
+        print("MySQL connected")
+    except Exception as e:
+        print(f"MySQL connection error: {e}")
+        ok = False
+    
+    try:
+        mongo_client.admin.command("ping")
+        print("MongoDB connected")
+    except Exception as e:
+        print(f"MongoDB connection error: {e}")
+        ok = False
+    return ok
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,236 @@
+# coordination.py
+
+import math
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from config import db_mongo
+
+
+class LeaseManager:
+    """Pair ownership leases shared by every backend instance through MongoDB.
+
+    A lease document {_id: pair_name, owner, expires_at, epoch, rate_tat}
+    says which instance runs a pair. Claims are a single atomic upsert that
+    only matches a lease that is free, expired or already ours, so two
+    instances can never both own a pair. Every claim increments `epoch`,
+    which fences writes of earlier owners (see ProgressCheckpoint.save).
+    `rate_tat` carries the pair's rate-limit state (GCRA arrival time on the
+    wall clock) from one owner to the next.
+
+    An owner stops sending `clock_margin` seconds before its lease expires
+    by its own monotonic clock, so a paused process or failed renewals can
+    not overlap with the next owner.
+    """
+
+    leases = db_mongo["pair_leases"]
+    instances = db_mongo["instances"]
+
+    def __init__(self, instance_id=None, ttl=None):
+        self.instance_id = instance_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.ttl = ttl or float(os.getenv("SMS_LEASE_TTL", "15"))
+        self.clock_margin = float(os.getenv("SMS_LEASE_CLOCK_MARGIN", "1"))
+
+    def deadline(self, requested_at):
+        """Monotonic time after which a lease taken or renewed at `requested_at` may be gone"""
+        return requested_at + self.ttl - self.clock_margin
+
+    def claim(self, pair_name):
+        """Take the lease of a pair; returns the lease document or None if another instance holds it"""
+        now = datetime.utcnow()
+        try:
+            return self.leases.find_one_and_update(
+                {
+                    "_id": pair_name,
+                    "$or": [{"owner": self.instance_id}, {"expires_at": {"$lt": now}}]
+                },
+                {
+                    "$set": {"owner": self.instance_id, "expires_at": now + timedelta(seconds=self.ttl)},
+                    "$inc": {"epoch": 1}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None
+
+    def renew(self, rate_tats):
+        """Extend our leases; `rate_tats` maps pair_name -> rate_tat.
+
+        Returns the pairs whose lease we no longer hold.
+        """
+        if not rate_tats:
+            return set()
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        self.leases.bulk_write([
+            UpdateOne(
+                {"_id": pair_name, "owner": self.instance_id},
+                {"$set": {"expires_at": expires_at, "rate_tat": rate_tat}}
+            )
+            for pair_name, rate_tat in rate_tats.items()
+        ], ordered=False)
+        held = {
+            doc["_id"] for doc in self.leases.find(
+                {"_id": {"$in": list(rate_tats)}, "owner": self.instance_id}, {"_id": 1}
+            )
+        }
+        return set(rate_tats) - held
+
+    def release(self, pair_name, rate_tat=None):
+        """Let another instance claim the pair right away"""
+        self.leases.update_one(
+            {"_id": pair_name, "owner": self.instance_id},
+            {"$set": {"expires_at": datetime.utcfromtimestamp(0), "rate_tat": rate_tat}}
+        )
+
+    def held_elsewhere(self, pair_name):
+        """Whether another instance holds a live lease on the pair"""
+        return self.leases.count_documents({
+            "_id": pair_name,
+            "owner": {"$ne": self.instance_id},
+            "expires_at": {"$gt": datetime.utcnow()}
+        }) > 0
+
+    def heartbeat(self):
+        """Mark this instance as alive; returns the number of live instances"""
+        now = datetime.utcnow()
+        self.instances.update_one(
+            {"_id": self.instance_id},
+            {"$set": {"expires_at": now + timedelta(seconds=self.ttl)}},
+            upsert=True
+        )
+        return max(self.instances.count_documents({"expires_at": {"$gt": now}}), 1)
+
+    def unclaimed(self, pairs_collection, limit):
+        """Names of active pairs whose lease is missing or expired"""
+        now = datetime.utcnow()
+        return [
+            doc["pair_name"] for doc in pairs_collection.aggregate([
+                {"$match": {"active_status": True}},
+                {"$project": {"pair_name": 1}},
+                {"$lookup": {
+                    "from": self.leases.name,
+                    "localField": "pair_name",
+                    "foreignField": "_id",
+                    "as": "lease"
+                }},
+                {"$match": {"$or": [
+                    {"lease": {"$size": 0}},
+                    {"lease.0.expires_at": {"$lt": now}}
+                ]}},
+                {"$limit": limit}
+            ])
+        ]
+
+
+class Coordinator:
+    """Background loop that spreads active pairs across instances.
+
+    Every ttl/3 seconds it renews our leases (stopping pairs whose lease was
+    lost), stops pairs that were deactivated elsewhere, hands back pairs
+    above our fair share and claims unowned active pairs up to it.
+    `service_cls` is SMSService; it is passed in to avoid a circular import.
+    """
+
+    def __init__(self, service_cls, pairs_collection, leases=None):
+        self.service_cls = service_cls
+        self.pairs = pairs_collection
+        self.leases = leases or LeaseManager()
+        self._stop = Event()
+        self._thread = None
+        self._start_lock = Lock()
+
+    def start(self):
+        """Start the background loop; later calls do nothing"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = Thread(target=self._run, name="sms-coordinator")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def claim(self, service):
+        """Claim a pair before running it locally; False if another instance owns it"""
+        requested_at = time.monotonic()
+        lease = self.leases.claim(service.pair_name)
+        if lease is None:
+            return False
+        service.lease_deadline = self.leases.deadline(requested_at)
+        service.checkpoint.epoch = lease.get("epoch")
+        if lease.get("rate_tat"):
+            service.rate_limiter.import_tat(lease["rate_tat"])
+        return True
+
+    def wait_released(self, pair_name, timeout=None):
+        """Wait until no other instance runs the pair; False on timeout.
+
+        The owner sees a deactivated pair within ttl/3 seconds and releases it
+        once its in-flight sends are done (at most `stop_timeout` later).
+        """
+        timeout = timeout or self.leases.ttl + self.service_cls.stop_timeout
+        deadline = time.monotonic() + timeout
+        while self.leases.held_elsewhere(pair_name):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+        return True
+
+    def release(self, pair_name, rate_limiter):
+        try:
+            self.leases.release(pair_name, rate_limiter.export_tat())
+        except Exception as e:
+            print(f"Failed to release lease of {pair_name}: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.leases.ttl / 3):
+            try:
+                self.balance()
+            except Exception as e:
+                print(f"Coordination round failed: {e}")
+
+    def balance(self):
+        running = dict(self.service_cls.running_pairs)
+        live_instances = self.leases.heartbeat()
+
+        requested_at = time.monotonic()
+        lost = self.leases.renew({
+            pair_name: service.rate_limiter.export_tat()
+            for pair_name, service in running.items()
+        })
+        for pair_name, service in running.items():
+            if pair_name not in lost:
+                service.lease_deadline = self.leases.deadline(requested_at)
+        # Pairs deactivated or deleted elsewhere
+        still_active = {
+            doc["pair_name"] for doc in self.pairs.find(
+                {"pair_name": {"$in": list(running)}, "active_status": True},
+                {"pair_name": 1}
+            )
+        } if running else set()
+        deactivated = set(running) - still_active
+        for pair_name in lost | deactivated:
+            self.service_cls.stop_local(pair_name, wait=False)
+            running.pop(pair_name, None)
+
+        active_pairs = self.pairs.count_documents({"active_status": True})
+        fair_share = math.ceil(active_pairs / live_instances)
+
+        # Hand back the lowest priority pairs above our share, with one pair of slack
+        if len(running) > fair_share + 1:
+            surplus = sorted(running.values(), key=lambda service: service.priority)
+            for service in surplus[:len(running) - fair_share]:
+                self.service_cls.stop_local(service.pair_name, wait=False)
+
+        elif len(running) < fair_share:
+            for pair_name in self.leases.unclaimed(self.pairs, fair_share - len(running)):
+                self.service_cls.run_local(pair_name)
@@ -0,0 +1,93 @@
+# indexes.py
+
+import argparse
+
+from sqlalchemy import text
+
+from config import app, db_SQL
+from models import MongoPair, PairNumbers, SmsStats, User
+from coordination import LeaseManager
+
+# (collection, keys, options) for every index the queries rely on
+MONGO_INDEXES = [
+    (MongoPair.collection, [("pair_name", 1)], {"unique": True}),
+    (MongoPair.collection, [("active_status", 1), ("_id", 1)], {}),
+    (MongoPair.collection, [("priority", 1), ("_id", 1)], {}),
+    (User.collection, [("username", 1)], {"unique": True}),
+    (User.collection, [("email", 1)], {"unique": True}),
+    # Releasing the numbers of a deleted list
+    (PairNumbers.collection, [("file_id", 1)], {}),
+    # Dead instances drop out of the live count on their own
+    (LeaseManager.instances, [("expires_at", 1)], {"expireAfterSeconds": 0}),
+]
+
+
+def ensure_indexes():
+    """Create every MongoDB and SQL index that is missing.
+
+    Safe to run on every startup: existing indexes are left untouched.
+    """
+    for collection, keys, options in MONGO_INDEXES:
+        collection.create_index(keys, **options)
+
+    with app.app_context():
+        for index in SmsStats.__table__.indexes:
+            index.create(bind=db_SQL.engine, checkfirst=True)
+
+
+def explain_plans(pair_name="example"):
+    """Describe how the hot lookups are executed, as {query: plan}"""
+    plans = {}
+
+    for label, query in [
+        ("pairs by pair_name", {"pair_name": pair_name}),
+        ("pairs by active_status", {"active_status": True}),
+        ("pairs by priority", {"priority": 0}),
+    ]:
+        try:
+            plan = MongoPair.collection.find(query).explain()["queryPlanner"]["winningPlan"]
+            plans[label] = _mongo_stages(plan)
+        except Exception as e:
+            plans[label] = f"unavailable ({e})"
+
+    with app.app_context():
+        try:
+            if db_SQL.engine.dialect.name == "sqlite":
+                statement = "EXPLAIN QUERY PLAN SELECT * FROM sms_stats WHERE pair_name = :pair_name"
+            else:
+                statement = "EXPLAIN SELECT * FROM sms_stats WHERE pair_name = :pair_name"
+            rows = db_SQL.session.execute(text(statement), {"pair_name": pair_name}).mappings().all()
+            plans["sms_stats by pair_name"] = "; ".join(
+                ", ".join(f"{key}={value}" for key, value in row.items() if value is not None)
+                for row in rows
+            )
+        except Exception as e:
+            plans["sms_stats by pair_name"] = f"unavailable ({e})"
+
+    return plans
+
+
+def _mongo_stages(plan):
+    stages = []
+    while plan:
+        stage = plan.get("stage")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage")
+    return " <- ".join(stages)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create missing indexes")
+    parser.add_argument("--explain", action="store_true", help="print query plans before and after")
+    args = parser.parse_args()
+
+    before = explain_plans() if args.explain else None
+    ensure_indexes()
+    print("Indexes are up to date")
+
+    if args.explain:
+        after = explain_plans()
+        for label in after:
+            print(f"{label}:\n  before: {before[label]}\n  after:  {after[label]}")
@@ -1,5 +1,6 @@
 from config import app, db_SQL
 from models import SmsStats  
+from indexes import ensure_indexes
 
 def init_db():
     with app.app_context():
@@ -10,6 +11,9 @@ def init_db():
         db_SQL.create_all()
         
         print("Database tables created successfully!")
+    
+    ensure_indexes()
+    print("Indexes created successfully!")
 
 if __name__ == "__main__":
     init_db()
\ No newline at end of file
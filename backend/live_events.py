@@ -0,0 +1,142 @@
+# live_events.py
+
+import json
+import os
+import time
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+
+
+def format_event(event, data):
+    """One server-sent event, encoded once and shared by every subscriber"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscription:
+    def __init__(self, backlog):
+        self.queue = Queue(maxsize=backlog)
+        self.closed = False
+
+    def offer(self, message):
+        """Queue a frame; a viewer that fell `backlog` frames behind is closed and must reconnect"""
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            self.closed = True
+
+
+class EventHub:
+    """Pushes live counter deltas and pair state changes to dashboard viewers.
+
+    Senders only add to a pending frame under a lock. One publisher thread
+    encodes that frame every 1/fps seconds and hands the same string to every
+    subscriber, so the work per SMS does not grow with the number of viewers
+    and viewers never query the databases.
+    """
+
+    def __init__(self, fps=None, backlog=None, heartbeat=15.0):
+        self.fps = fps or float(os.getenv("SMS_EVENTS_FPS", "2"))
+        self.backlog = backlog or int(os.getenv("SMS_EVENTS_BACKLOG", "64"))
+        self.heartbeat = heartbeat
+        self._counts = {}  # pair_name -> [sent, failed] since the last frame
+        self._states = {}  # pair_name -> state since the last frame
+        self._subscribers = set()
+        self._lock = Lock()
+        self._thread = None
+
+    def count(self, pair_name, success, record=None):
+        """Add one SMS result to the next frame.
+
+        `record(pair_name, success)` (StatsAccumulator.record) runs under the
+        same lock, so a snapshot built by `subscribe` holds each result either
+        in the stored counts or in the first delta, never in both or neither.
+        """
+        with self._lock:
+            if record is not None:
+                record(pair_name, success)
+            if not self._subscribers:
+                return
+            counts = self._counts.get(pair_name)
+            if counts is None:
+                counts = self._counts[pair_name] = [0, 0]
+            counts[0 if success else 1] += 1
+
+    def pair_state(self, pair_name, state):
+        """Report that a pair is now running, stopped or finished"""
+        if not self._subscribers:
+            return
+        with self._lock:
+            self._states[pair_name] = state
+
+    def subscribe(self, build_snapshot):
+        """Register a viewer and build its snapshot, with no delta lost or counted twice.
+
+        `build_snapshot(unpublished)` runs while no count can be added; it gets
+        the (sent, failed) counted since the last frame, which the viewer also
+        receives in its first delta, so the snapshot must leave them out.
+        Returns the subscription and the snapshot to pass to `stream`.
+        """
+        subscription = Subscription(self.backlog)
+        with self._lock:
+            unpublished = (
+                sum(sent for sent, _ in self._counts.values()),
+                sum(failed for _, failed in self._counts.values())
+            )
+            snapshot = build_snapshot(unpublished)
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="sms-events")
+                self._thread.daemon = True
+                self._thread.start()
+        return subscription, snapshot
+
+    def stream(self, subscription, snapshot):
+        """Generator of SSE messages for one viewer: the snapshot, then a frame per change"""
+        try:
+            yield format_event("snapshot", snapshot)
+            while not subscription.closed:
+                try:
+                    yield subscription.queue.get(timeout=self.heartbeat)
+                except Empty:
+                    yield ": keep-alive\n\n"  # also detects viewers that went away
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscription)
+
+    def _take_frame(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            states, self._states = self._states, {}
+            subscribers = list(self._subscribers)
+        if not (counts or states) or not subscribers:
+            return None, subscribers
+
+        frame = {
+            "time": time.time(),
+            "pairs": {
+                pair_name: {"sent": sent, "failed": failed}
+                for pair_name, (sent, failed) in counts.items()
+            },
+            "totals": {
+                "sent": sum(sent for sent, _ in counts.values()),
+                "failed": sum(failed for _, failed in counts.values())
+            },
+            "states": states
+        }
+        return format_event("delta", frame), subscribers
+
+    def _run(self):
+        while True:
+            time.sleep(1 / self.fps)
+            try:
+                message, subscribers = self._take_frame()
+                if message is not None:
+                    for subscription in subscribers:
+                        subscription.offer(message)
+                # Viewers that fell behind, or whose response was never streamed
+                closed = [subscription for subscription in subscribers if subscription.closed]
+                if closed:
+                    with self._lock:
+                        self._subscribers.difference_update(closed)
+            except Exception as e:
+                print(f"Live event frame failed: {e}")
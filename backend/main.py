@@ -1,21 +1,59 @@
 from functools import wraps
 from bson import ObjectId
-from flask import request, jsonify
-from config import app, db_mongo, db_SQL
-from models import MongoPair, SmsStats, User
+from bson.errors import InvalidId
+from flask import Response, request, jsonify, stream_with_context
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import app, check_connections, db_mongo, db_SQL, mongo_pool_metrics, sql_pool_metrics
+from metrics import registry
+from models import GRANULARITIES, MongoPair, SmsStats, SmsStatsBucket, User
 from service import SMSService
+from indexes import ensure_indexes
+from stats_writer import RETENTION
+from token_cache import TokenCache
+from passwords import HasherBusy, PasswordHasher
+from checkpoints import ProgressCheckpoint
 from werkzeug.utils import secure_filename
-import bcrypt
 import jwt
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import hmac
 import os
 import random
+import signal
+import sys
+import threading
+import time
 
 # Load environment variables
 load_dotenv()
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-ALLOWED_EXTENSIONS = {'txt', 'csv'}
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # static bearer token for Prometheus scrapes
+EVENTS_TOKEN_TTL = int(os.getenv("SMS_EVENTS_TOKEN_TTL", "60"))  # seconds a /events stream token can be used
+ALLOWED_EXTENSIONS = {'txt', 'csv', 'xlsx'}
+PAIRS_PAGE_SIZE = 100
+PAIRS_MAX_PAGE_SIZE = 1000
+MAX_SERIES_POINTS = 120
+
+
+token_cache = TokenCache()
+password_hasher = PasswordHasher()
+
+
+def verify_token(token, scope=None):
+    """Return the claims of a valid token, decoding it only on a cache miss.
+    
+    Tokens with a scope (see /events/token) are only valid where that scope is asked for.
+    """
+    data = token_cache.get(token)
+    if data is None:
+        if token_cache.is_revoked(token):
+            raise jwt.InvalidTokenError("Token has been revoked")
+        data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        token_cache.put(token, data)
+    if data.get("scope") != scope:
+        raise jwt.InvalidTokenError("Token is not valid for this request")
+    return data
 
 
 # Authentication decorator
@@ -30,7 +68,7 @@ def token_required(f):
             return jsonify({"error": "Token is missing!"}), 401
         
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            data = verify_token(token)
             current_user = data['user_id']
         except Exception as e:
             return jsonify({"error": str(e)}), 401
@@ -44,6 +82,26 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def summarize_totals(totals):
+    """Aggregate stats as served by /stats/aggregate, from SmsStats.totals()"""
+    total_sms_sent = totals["total_sms_sent"]
+    total_sms_failed = totals["total_sms_failed"]
+    
+    if total_sms_sent > 0:
+        overall_success_rate = ((total_sms_sent - total_sms_failed) / total_sms_sent * 100)
+        overall_failure_rate = (total_sms_failed / total_sms_sent * 100)
+    else:
+        overall_success_rate = overall_failure_rate = 0
+    
+    return {
+        "total_pairs": totals["total_pairs"],
+        "total_sms_sent": total_sms_sent,
+        "total_sms_failed": total_sms_failed,
+        "overall_success_rate": round(overall_success_rate, 2),
+        "overall_failure_rate": round(overall_failure_rate, 2)
+    }
+
+
 # User Routes
 @app.route("/user/<user_id>", methods=["GET"])
 @token_required
@@ -68,10 +126,12 @@ def create_user():
         if not username or not password or not email:
             return jsonify({"error": "Missing required fields"}), 400
         
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = password_hasher.hash(password)
         user_id = User.insert_one(username=username, password=hashed_password, email=email)
 
         return jsonify({"message": "User created", "userId": str(user_id)}), 201
+    except HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -93,7 +153,7 @@ def sign_in():
             ]
         })
         
-        if user and bcrypt.checkpw(password.encode('utf-8'), user["password"].encode('utf-8')):
+        if user and password_hasher.check(password, user["password"]):
             token = jwt.encode({
                 "user_id": str(user["_id"]),
                 "exp": datetime.utcnow() + timedelta(hours=15)
@@ -101,6 +161,19 @@ def sign_in():
             
             return jsonify({"token": token}), 200
         return jsonify({"error": "Invalid credentials"}), 401
+    except HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/signout", methods=["POST"])
+@token_required
+def sign_out(current_user):
+    try:
+        token = request.headers['Authorization'].split(" ")[1]
+        token_cache.revoke(token, verify_token(token)["exp"])
+        return jsonify({"message": "Signed out"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -118,51 +191,61 @@ def create_program(current_user):
             return jsonify({"error": "No selected file"}), 400
             
         if not allowed_file(file.filename):
-            return jsonify({"error": "File type not allowed. Use .txt or .csv"}), 400
+            return jsonify({"error": "File type not allowed. Use .txt, .csv or .xlsx"}), 400
 
         # Get form data and validate
         pair_name = request.form.get("pair_name")
         proxy = request.form.get("proxy")
+        proxies = request.form.get("proxies")
+        proxies = MongoPair.parse_proxies(proxies) if proxies else None
+        proxy_routing = request.form.get("proxy_routing")
+        proxy_routing = MongoPair.parse_routing(proxy_routing) if proxy_routing else None
         active_status = request.form.get("active_status", "false").lower() == "true"
         priority = int(request.form.get("priority", "0"))
+        rate_limit = request.form.get("rate_limit")
+        rate_limit = int(rate_limit) if rate_limit else None
         
-        if not all([pair_name, proxy]):
+        if not pair_name or not (proxy or proxies):
             return jsonify({
-                "error": "Missing required fields: pair_name and proxy are required"
+                "error": "Missing required fields: pair_name and proxy (or proxies) are required"
             }), 400
+        
+        if rate_limit is not None and rate_limit <= 0:
+            return jsonify({"error": "rate_limit must be a positive number"}), 400
             
-        # Check existing pair
-        existing_pair = MongoPair.collection.find_one({"pair_name": pair_name})
-        if existing_pair:
-            return jsonify({"error": "Pair with this name already exists"}), 409
-
-        # Process file
+        # Process file, streamed into GridFS by MongoPair.insert_one
         filename = secure_filename(file.filename)
-        file_content = file.read()
         file_data = {
             "filename": filename,
-            "content": file_content,
+            "stream": file.stream,
             "content_type": file.content_type or "text/plain"
         }
         
-        # Create pair
-        pair_id = MongoPair.insert_one(
+        # Create pair, the unique index on pair_name rejects duplicates
+        created_pair = MongoPair.insert_one(
             pair_name=pair_name,
             active_status=active_status,
             priority=priority,
             session_details={},
             proxy=proxy,
-            number_list_file=file_data
+            number_list_file=file_data,
+            rate_limit=rate_limit,
+            proxies=proxies,
+            proxy_routing=proxy_routing
         )
         
-        created_pair = MongoPair.collection.find_one({"_id": pair_id})
         
         return jsonify({
             "message": "Pair created successfully",
-            "pair_id": str(pair_id),
-            "pair": MongoPair.to_json(created_pair)
+            "pair_id": str(created_pair["_id"]),
+            "pair": MongoPair.to_json(created_pair),
+            "upload_stats": created_pair["number_list_file"]["stats"]
         }), 201
         
+    except DuplicateKeyError:
+        return jsonify({"error": "Pair with this name already exists"}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -171,32 +254,55 @@ def create_program(current_user):
 @token_required
 def update_pair(current_user, pair_id):
     try:
-        pair = MongoPair.collection.find_one({"_id": ObjectId(pair_id)})
-        if not pair:
-            return jsonify({"error": "Pair not found"}), 404
-
         if not request.is_json:
             return jsonify({"error": "Invalid content type, must be application/json"}), 415
             
         data = request.get_json()
-        updatable_fields = ["pair_name", "active_status", "priority", "proxy"]
+        updatable_fields = ["pair_name", "active_status", "priority", "proxy", "proxies", "proxy_routing", "rate_limit"]
         update_data = {field: data[field] for field in updatable_fields if field in data}
         
+        # Running pairs switch to new proxies when they are restarted
+        if update_data.get("proxies") is not None:
+            update_data["proxies"] = MongoPair.parse_proxies(update_data["proxies"])
+            update_data.setdefault("proxy", update_data["proxies"][0]["proxy"])
+        if update_data.get("proxy_routing") is not None:
+            MongoPair.parse_routing(update_data["proxy_routing"])
+        
         if "active_status" in update_data:
             update_data["active_status"] = str(update_data["active_status"]).lower() == "true"
         
-        MongoPair.collection.update_one(
-            {"_id": ObjectId(pair_id)}, 
-            {"$set": update_data}
-        )
+        if update_data.get("rate_limit") is not None:
+            update_data["rate_limit"] = int(update_data["rate_limit"])
+            if update_data["rate_limit"] <= 0:
+                return jsonify({"error": "rate_limit must be a positive number"}), 400
+        
+        # One round trip: update and read back the new document atomically
+        if update_data:
+            updated_pair = MongoPair.collection.find_one_and_update(
+                {"_id": ObjectId(pair_id)},
+                {"$set": update_data},
+                projection=MongoPair.PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+        else:
+            updated_pair = MongoPair.collection.find_one({"_id": ObjectId(pair_id)}, MongoPair.PROJECTION)
         
-        updated_pair = MongoPair.collection.find_one({"_id": ObjectId(pair_id)})
+        if not updated_pair:
+            return jsonify({"error": "Pair not found"}), 404
+        
+        if update_data.get("rate_limit") is not None:
+            # Running pairs pick up the new limit right away
+            SMSService.rate_limits.get(updated_pair["pair_name"], update_data["rate_limit"])
         
         return jsonify({
             "message": "Pair updated successfully",
             "pair": MongoPair.to_json(updated_pair)
         }), 200
 
+    except DuplicateKeyError:
+        return jsonify({"error": "Pair with this name already exists"}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -205,24 +311,30 @@ def update_pair(current_user, pair_id):
 @token_required
 def delete_pair(current_user, pair_id):
     try:
-        pair = MongoPair.collection.find_one({"_id": ObjectId(pair_id)})
+        pair = MongoPair.collection.find_one({"_id": ObjectId(pair_id)}, MongoPair.PROJECTION)
         if not pair:
             return jsonify({"error": "Pair not found"}), 404
             
         pair_name = pair.get("pair_name")
         
-        # Stop running pair if necessary
-        if pair_name in SMSService.running_pairs:
+        # Stop running pair if necessary, also when another instance runs it
+        if pair_name in SMSService.running_pairs or SMSService.coordinator:
             stop_result = SMSService.stop_pair(pair_name)
             if not stop_result["success"]:
                 return jsonify({"error": stop_result["message"]}), 400
+            # Its owner flushes the pair's stats before releasing it, so they are deleted below
+            if SMSService.coordinator and not SMSService.coordinator.wait_released(pair_name):
+                return jsonify({"error": f"Pair {pair_name} is still stopping on another instance, try again"}), 409
         
         # Delete SQL stats
+        SMSService.stats.discard(pair_name)
         try:
             stats = SmsStats.query.filter_by(pair_name=pair_name).first()
             if stats:
                 db_SQL.session.delete(stats)
-                db_SQL.session.commit()
+            SmsStatsBucket.query.filter_by(pair_name=pair_name).delete()
+            db_SQL.session.commit()
+            SMSService.stats.aggregate.invalidate()
         except Exception as e:
             db_SQL.session.rollback()
             return jsonify({"error": f"Failed to delete SMS stats: {str(e)}"}), 500
@@ -231,6 +343,9 @@ def delete_pair(current_user, pair_id):
         delete_result = MongoPair.collection.delete_one({"_id": ObjectId(pair_id)})
         if delete_result.deleted_count == 0:
             return jsonify({"error": "Failed to delete pair"}), 500
+        MongoPair.delete_file(pair.get("number_list_file"))
+        ProgressCheckpoint.delete(pair_name)
+        SMSService.rate_limits.discard(pair_name)
             
         return jsonify({
             "message": f"Pair {pair_name} deleted successfully",
@@ -251,7 +366,7 @@ def program_operation(current_user, operation):
         if not pair_name:
             return jsonify({"error": "Missing pair name"}), 400
         
-        pair = MongoPair.collection.find_one({"pair_name": pair_name})
+        pair = MongoPair.collection.find_one({"pair_name": pair_name}, {"_id": 1})
         if not pair:
             return jsonify({"error": "Pair not found"}), 404
             
@@ -273,14 +388,51 @@ def program_operation(current_user, operation):
 @app.route("/program/pairs", methods=["GET"])
 @token_required
 def get_all_pairs(current_user):
+    """List pairs one page at a time, ordered by _id.
+    
+    Query parameters: `limit`, `after` (the X-Next-Cursor of the previous
+    page), `active_status` and `priority`.
+    """
     try:
-        all_pairs = list(MongoPair.collection.find())
-        pairs_json = []
-        for pair in all_pairs:
-            pair_dict = MongoPair.to_json(pair)
-            pair_dict["pair_id"] = str(pair["_id"])
-            pairs_json.append(pair_dict)
-        return jsonify(pairs_json), 200
+        try:
+            limit = min(int(request.args.get("limit", PAIRS_PAGE_SIZE)), PAIRS_MAX_PAGE_SIZE)
+            query = {}
+            if request.args.get("after"):
+                query["_id"] = {"$gt": ObjectId(request.args["after"])}
+            if request.args.get("active_status") is not None:
+                query["active_status"] = request.args["active_status"].lower() == "true"
+            if request.args.get("priority") is not None:
+                query["priority"] = int(request.args["priority"])
+        except (ValueError, InvalidId) as e:
+            return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+        
+        if limit <= 0:
+            return jsonify({"error": "limit must be a positive number"}), 400
+        
+        # The last _id of this page is the cursor for the next one, sent only
+        # when a pair follows it. Only the _id index is read to find both, so
+        # the page itself can be streamed.
+        boundary = list(
+            MongoPair.collection.find(query, {"_id": 1})
+            .sort("_id", 1).skip(limit - 1).limit(2)
+        )
+        cursor = (
+            MongoPair.collection.find(query, MongoPair.LIST_PROJECTION)
+            .sort("_id", 1).limit(limit)
+        )
+        
+        def generate():
+            yield "["
+            for i, pair in enumerate(cursor):
+                pair_dict = MongoPair.to_json(pair)
+                pair_dict["pair_id"] = str(pair["_id"])
+                yield ("," if i else "") + app.json.dumps(pair_dict)
+            yield "]"
+        
+        response = Response(stream_with_context(generate()), mimetype="application/json")
+        if len(boundary) == 2:
+            response.headers["X-Next-Cursor"] = str(boundary[0]["_id"])
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -289,7 +441,7 @@ def get_all_pairs(current_user):
 @token_required
 def get_sms_stats(current_user, pair_name):
     try:
-        pair = MongoPair.collection.find_one({"pair_name": pair_name})
+        pair = MongoPair.collection.find_one({"pair_name": pair_name}, {"_id": 1})
         if not pair:
             return jsonify({"error": "Pair not found"}), 404
 
@@ -297,12 +449,18 @@ def get_sms_stats(current_user, pair_name):
         if not stats:
             return jsonify({"message": "No stats found for this pair", "stats": None}), 404
 
+        # Include counts the stats writer has not flushed yet
+        pending_sent, pending_failed = SMSService.stats.pending(pair_name)
+        total_sms_sent = stats.total_sms_sent + pending_sent
+        total_sms_failed = stats.total_sms_failed + pending_failed
+        rate_of_success, rate_of_failure = SmsStats.rates(total_sms_sent, total_sms_failed)
+
         stats_dict = {
             "pair_name": stats.pair_name,
-            "total_sms_sent": stats.total_sms_sent,
-            "total_sms_failed": stats.total_sms_failed,
-            "total_rate_of_success": stats.total_rate_of_success,
-            "total_rate_of_failure": stats.total_rate_of_failure
+            "total_sms_sent": total_sms_sent,
+            "total_sms_failed": total_sms_failed,
+            "total_rate_of_success": rate_of_success,
+            "total_rate_of_failure": rate_of_failure
         }
 
         return jsonify({
@@ -314,34 +472,78 @@ def get_sms_stats(current_user, pair_name):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/stats/<pair_name>/timeseries", methods=["GET"])
+@token_required
+def get_sms_timeseries(current_user, pair_name):
+    """Delivery counts of a pair over the last `window` seconds.
+    
+    Read from the pre-computed minute/hour/day buckets; `granularity` is
+    picked from the window when not given, so at most a few hundred rows are
+    read however long the window is.
+    """
+    try:
+        window = int(request.args.get("window", 3600))
+        granularity = request.args.get("granularity")
+        if window <= 0:
+            return jsonify({"error": "window must be a positive number of seconds"}), 400
+        
+        if granularity is None:
+            granularity = next(
+                (name for name, size in GRANULARITIES.items()
+                 if window // size <= MAX_SERIES_POINTS and window <= RETENTION[name]),
+                "day"
+            )
+        elif granularity not in GRANULARITIES:
+            return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+        
+        pair = MongoPair.collection.find_one({"pair_name": pair_name}, {"_id": 1})
+        if not pair:
+            return jsonify({"error": "Pair not found"}), 404
+        
+        size = GRANULARITIES[granularity]
+        now = int(time.time())
+        # The first bucket starts up to one bucket before the window does
+        start = (now - window) // size * size
+        buckets = SmsStatsBucket.series(pair_name, granularity, datetime.utcfromtimestamp(start))
+        
+        total_sms_sent = sum(bucket.total_sms_sent for bucket in buckets)
+        total_sms_failed = sum(bucket.total_sms_failed for bucket in buckets)
+        rate_of_success, rate_of_failure = SmsStats.rates(total_sms_sent, total_sms_failed)
+        
+        return jsonify({
+            "message": "Stats retrieved successfully",
+            "stats": {
+                "pair_name": pair_name,
+                "window": window,
+                "granularity": granularity,
+                "total_sms_sent": total_sms_sent,
+                "total_sms_failed": total_sms_failed,
+                "rate_of_success": rate_of_success,
+                "rate_of_failure": rate_of_failure,
+                "sends_per_second": round((total_sms_sent + total_sms_failed) / (now - start), 3),
+                "buckets": [bucket.to_json() for bucket in buckets]
+            }
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/stats/aggregate", methods=["GET"])
 @token_required
 def get_aggregate_stats(current_user):
     try:
-        all_stats = SmsStats.query.all()
+        totals = SMSService.stats.aggregate.get(SmsStats.totals)
         
-        if not all_stats:
+        if not totals["total_pairs"]:
             return jsonify({
                 "message": "No stats found in the database",
                 "stats": None
             }), 404
         
-        total_sms_sent = sum(stat.total_sms_sent for stat in all_stats)
-        total_sms_failed = sum(stat.total_sms_failed for stat in all_stats)
-        
-        if total_sms_sent > 0:
-            overall_success_rate = ((total_sms_sent - total_sms_failed) / total_sms_sent * 100)
-            overall_failure_rate = (total_sms_failed / total_sms_sent * 100)
-        else:
-            overall_success_rate = overall_failure_rate = 0
-        
-        aggregate_stats = {
-            "total_pairs": len(all_stats),
-            "total_sms_sent": total_sms_sent,
-            "total_sms_failed": total_sms_failed,
-            "overall_success_rate": round(overall_success_rate, 2),
-            "overall_failure_rate": round(overall_failure_rate, 2)
-        }
+        aggregate_stats = summarize_totals(totals)
         
         return jsonify({
             "message": "Aggregate stats retrieved successfully",
@@ -351,6 +553,96 @@ def get_aggregate_stats(current_user):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/metrics/pools", methods=["GET"])
+@token_required
+def get_pool_metrics(current_user):
+    """Connection pool and proxy usage, for diagnosing pool starvation"""
+    return jsonify({
+        "sql": sql_pool_metrics.snapshot(),
+        "mongo": mongo_pool_metrics.snapshot(),
+        "proxies": SMSService.proxies.snapshot(),
+        "dispatch_queue": SMSService.scheduler.pending(),
+        "running_pairs": len(SMSService.running_pairs)
+    }), 200
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Per-stage latency histograms and result/error counters in the Prometheus text format.
+    
+    Scrapers authenticate with `Bearer <METRICS_TOKEN>` when it is set, otherwise with a user token.
+    """
+    token = request.headers.get("Authorization", "").partition(" ")[2]
+    if not token:
+        return jsonify({"error": "Token is missing!"}), 401
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(token, METRICS_TOKEN):
+            return jsonify({"error": "Invalid metrics token"}), 401
+    else:
+        try:
+            verify_token(token)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 401
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/events/token", methods=["POST"])
+@token_required
+def live_events_token(current_user):
+    """Short-lived token that only opens /events.
+    
+    EventSource cannot set headers, so the stream token goes in the URL, where
+    request logs and proxies may keep it; it expires before it is of use to anyone.
+    """
+    token = jwt.encode({
+        "user_id": current_user,
+        "scope": "events",
+        "exp": datetime.utcnow() + timedelta(seconds=EVENTS_TOKEN_TTL)
+    }, SECRET_KEY, algorithm="HS256")
+    return jsonify({"token": token, "expires_in": EVENTS_TOKEN_TTL}), 200
+
+@app.route("/events", methods=["GET"])
+def live_events():
+    """Server-sent events: a snapshot, then coalesced stats deltas and pair state changes.
+    
+    Takes a token from /events/token as ?token=, or a login token in the Authorization header.
+    """
+    try:
+        if request.args.get("token"):
+            verify_token(request.args["token"], scope="events")
+        elif 'Authorization' in request.headers:
+            verify_token(request.headers['Authorization'].split(" ")[1])
+        else:
+            return jsonify({"error": "Token is missing!"}), 401
+    except Exception as e:
+        return jsonify({"error": str(e)}), 401
+    
+    def build_snapshot(totals, unpublished):
+        # Written counts plus the ones waiting for a flush, less those the first delta will carry
+        pending_sent, pending_failed = SMSService.stats.pending_totals()
+        totals["total_sms_sent"] += pending_sent - unpublished[0]
+        totals["total_sms_failed"] += pending_failed - unpublished[1]
+        return {
+            "time": time.time(),
+            "stats": summarize_totals(totals),
+            "running_pairs": sorted(SMSService.running_pairs)
+        }
+    
+    try:
+        # No flush may move counts from pending to written while the snapshot is
+        # built, and it is built as the viewer subscribes, so no delta is lost
+        with SMSService.stats.hold_flushes():
+            totals = dict(SMSService.stats.aggregate.get(SmsStats.totals))
+            subscription, snapshot = SMSService.events.subscribe(
+                lambda unpublished: build_snapshot(totals, unpublished)
+            )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    return Response(
+        stream_with_context(SMSService.events.stream(subscription, snapshot)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 #fetching dummy stats data into the database, might comment out later
 @app.route("/stats/dummy", methods=["POST"])
 @token_required
@@ -363,7 +655,7 @@ def create_dummy_stats(current_user):
             if field not in data:
                 return jsonify({"error": f"Missing required field: {field}"}), 400
                 
-        pair = MongoPair.collection.find_one({"pair_name": data["pair_name"]})
+        pair = MongoPair.collection.find_one({"pair_name": data["pair_name"]}, {"_id": 1})
         if not pair:
             return jsonify({"error": "Pair not found in database"}), 404
             
@@ -394,6 +686,7 @@ def create_dummy_stats(current_user):
             db_SQL.session.add(new_stats)
         
         db_SQL.session.commit()
+        SMSService.stats.aggregate.invalidate()
         stats_dict = new_stats.to_json() if not existing_stats else existing_stats.to_json()
         
         return jsonify({
@@ -406,6 +699,32 @@ def create_dummy_stats(current_user):
         return jsonify({"error": str(e)}), 500
 
 
+_started = False
+_start_lock = threading.Lock()
+
+@app.before_request
+def start_service():
+    """Start the background work of the service once this process serves requests.
+    
+    Runs under any WSGI server (gunicorn, flask run, python main.py), never at
+    import, so tools and forked workers only start it where requests are served.
+    """
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        SMSService.start_coordination()
+        # Indexes the lookups rely on; existing ones are left untouched
+        try:
+            ensure_indexes()
+        except Exception as e:
+            print(f"Failed to create indexes, retrying on the next request: {e}")
+            return
+        _started = True
+
+
 # Home Route
 @app.route("/", methods=["GET"])
 def get_home():
@@ -413,6 +732,10 @@ def get_home():
 
 
 if __name__ == "__main__":
+    check_connections()
     with app.app_context():
         db_SQL.create_all()
+    # SIGTERM exits normally, so the batched stats are flushed by their atexit hook
+    # (gunicorn workers already exit that way on a graceful shutdown)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,192 @@
+# metrics.py
+
+import asyncio
+import math
+from bisect import bisect_left
+from concurrent.futures import CancelledError
+from threading import Lock, local
+
+# Upper bounds (seconds) of the latency buckets, 100us to 60s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class _Family:
+    """A metric with fixed label names whose samples are kept per thread.
+
+    Every thread writes only to its own shard, so recording takes no lock;
+    `collect` adds the shards together when the metrics are scraped.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._local = local()
+        self._shards = []
+        self._lock = Lock()
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def _labels(self, values, extra=""):
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def inc(self, labels, amount=1):
+        values = self._shard()
+        values[labels] = values.get(labels, 0) + amount
+
+    def collect(self):
+        totals = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render(self):
+        for labels, value in sorted(self.collect().items()):
+            yield f"{self.name}{self._labels(labels)} {value}"
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        self._size = len(buckets) + 2  # one count per bucket, +Inf, then the sum
+
+    def observe(self, labels, value):
+        values = self._shard()
+        counts = values.get(labels)
+        if counts is None:
+            counts = values[labels] = [0] * self._size
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self):
+        totals = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for labels, counts in list(shard.items()):
+                total = totals.get(labels)
+                if total is None:
+                    total = totals[labels] = [0] * self._size
+                for i, count in enumerate(list(counts)):
+                    total[i] += count
+        return totals
+
+    def render(self):
+        for labels, counts in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == math.inf else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{self._labels(labels, le)} {cumulative}"
+            yield f"{self.name}_sum{self._labels(labels)} {counts[-1]}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+
+class Gauge(_Family):
+    """Values read from `callback` (returning {labels: value}) at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames, callback, kind=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        if kind:
+            self.kind = kind
+
+    def render(self):
+        for labels, value in sorted(self.callback().items()):
+            yield f"{self.name}{self._labels(labels)} {value}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families = []
+
+    def counter(self, name, documentation, labelnames):
+        family = Counter(name, documentation, labelnames)
+        self.families.append(family)
+        return family
+
+    def histogram(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        family = Histogram(name, documentation, labelnames, buckets)
+        self.families.append(family)
+        return family
+
+    def gauge(self, name, documentation, labelnames, callback, kind=None):
+        family = Gauge(name, documentation, labelnames, callback, kind)
+        self.families.append(family)
+        return family
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for family in self.families:
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def classify_error(error):
+    """Short, low-cardinality name for why a send failed"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if isinstance(error, CancelledError):
+        return "cancelled"
+    try:
+        import aiohttp
+    except ImportError:
+        return "other"
+    if isinstance(error, (aiohttp.ClientProxyConnectionError, aiohttp.ClientHttpProxyError)):
+        return "proxy"
+    if isinstance(error, aiohttp.ClientResponseError):
+        return f"http_{error.status}"
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return "connection"
+    if isinstance(error, aiohttp.ClientError):
+        return "client"
+    return "other"
+
+
+registry = MetricsRegistry()
+
+# Stages: read (next number from the list), rate_limit_wait, send (SendOtp),
+# submit (SumitOtp), sms (dispatch to completion), checkpoint_save, stats_flush
+stage_seconds = registry.histogram(
+    "sms_stage_seconds", "Latency of each send pipeline stage", ("stage", "pair", "proxy")
+)
+results_total = registry.counter(
+    "sms_results_total", "SMS sends by outcome", ("pair", "proxy", "result")
+)
+errors_total = registry.counter(
+    "sms_errors_total", "Failed or rejected sends by cause", ("pair", "proxy", "kind")
+)
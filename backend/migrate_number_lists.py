@@ -0,0 +1,17 @@
+from models import MongoPair
+from phone_numbers import DEDUP_ACROSS_PAIRS
+
+def migrate_number_lists():
+    # Move number lists stored inside pair documents into GridFS
+    migrated = MongoPair.migrate_inline_files()
+    print(f"Moved {migrated} number list(s) into GridFS")
+    # Convert uploaded lists that are still stored as text or Excel into the packed format
+    packed = MongoPair.pack_number_lists()
+    print(f"Packed {packed} number list(s)")
+    if DEDUP_ACROSS_PAIRS:
+        # Record the numbers of lists uploaded while cross-pair deduplication was off
+        indexed = MongoPair.index_number_lists()
+        print(f"Indexed {indexed} number list(s) for deduplication across pairs")
+
+if __name__ == "__main__":
+    migrate_number_lists()
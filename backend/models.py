@@ -1,8 +1,18 @@
 from config import db_SQL, db_mongo
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from datetime import datetime
-from bson import Binary
+from gridfs import GridFSBucket
+from number_reader import PACKED_CONTENT_TYPE, PACKED_EXTENSION, is_packed, iter_numbers, iter_packed, write_packed
+from phone_numbers import DEDUP_ACROSS_PAIRS, dedupe, new_stats, normalize_all
+from proxy_control import ROUTINGS
 import io
+import json
+
+
+FILE_CHUNK_SIZE = 255 * 1024
+
+# Bucket sizes (seconds) of the per-pair time series, finest first
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
 
 
 # MySQL Model 2
@@ -10,7 +20,7 @@ class SmsStats(db_SQL.Model):
     __tablename__ = "sms_stats"
 
     id = db_SQL.Column(db_SQL.Integer, primary_key=True)
-    pair_name = db_SQL.Column(db_SQL.String(80), unique=False, nullable=False)
+    pair_name = db_SQL.Column(db_SQL.String(80), unique=True, index=True, nullable=False)
     total_sms_sent = db_SQL.Column(db_SQL.Integer, nullable=False)
     total_sms_failed = db_SQL.Column(db_SQL.Integer, nullable=False)
     total_rate_of_success = db_SQL.Column(db_SQL.Integer, nullable=False)
@@ -22,22 +32,157 @@ class SmsStats(db_SQL.Model):
         onupdate=datetime.utcnow
     )
 
+    @staticmethod
+    def rates(sent, failed):
+        """Success and failure rate in percent, derived from the counts"""
+        total_attempts = sent + failed
+        if not total_attempts:
+            return 0, 0
+        return (
+            round(sent * 100 / total_attempts, 2),
+            round(failed * 100 / total_attempts, 2)
+        )
+
+    @classmethod
+    def totals(cls):
+        """Pair count and summed counters of all pairs, computed in SQL"""
+        total_pairs, total_sms_sent, total_sms_failed = db_SQL.session.query(
+            db_SQL.func.count(cls.id),
+            db_SQL.func.coalesce(db_SQL.func.sum(cls.total_sms_sent), 0),
+            db_SQL.func.coalesce(db_SQL.func.sum(cls.total_sms_failed), 0)
+        ).one()
+        return {
+            "total_pairs": total_pairs,
+            "total_sms_sent": int(total_sms_sent),
+            "total_sms_failed": int(total_sms_failed)
+        }
+
     def to_json(self):
+        rate_of_success, rate_of_failure = self.rates(self.total_sms_sent, self.total_sms_failed)
         return {
             "id": self.id,
             "pairName": self.pair_name,
             "totalSmsSent": self.total_sms_sent,
             "totalSmsFailed": self.total_sms_failed,
-            "totalRateOfSuccess": self.total_rate_of_success,
-            "totalRateOfFailure": self.total_rate_of_failure,
+            "totalRateOfSuccess": rate_of_success,
+            "totalRateOfFailure": rate_of_failure,
             # "createdAt": self.created_at.isoformat() if self.created_at else None,
             # "updatedAt": self.updated_at.isoformat() if self.updated_at else None
         }
 
 
+# MySQL Model 3
+class SmsStatsBucket(db_SQL.Model):
+    """Delivery counts of one pair within one minute, hour or day"""
+    __tablename__ = "sms_stats_buckets"
+    __table_args__ = (
+        db_SQL.UniqueConstraint("pair_name", "granularity", "bucket_start", name="uq_sms_stats_bucket"),
+    )
+
+    id = db_SQL.Column(db_SQL.Integer, primary_key=True)
+    pair_name = db_SQL.Column(db_SQL.String(80), nullable=False)
+    granularity = db_SQL.Column(db_SQL.String(8), nullable=False)
+    bucket_start = db_SQL.Column(db_SQL.DateTime, nullable=False)
+    total_sms_sent = db_SQL.Column(db_SQL.Integer, nullable=False, default=0)
+    total_sms_failed = db_SQL.Column(db_SQL.Integer, nullable=False, default=0)
+
+    @classmethod
+    def series(cls, pair_name, granularity, since):
+        """Buckets of the pair from `since` on, oldest first"""
+        return (
+            cls.query
+            .filter(
+                cls.pair_name == pair_name,
+                cls.granularity == granularity,
+                cls.bucket_start >= since
+            )
+            .order_by(cls.bucket_start)
+            .all()
+        )
+
+    def to_json(self):
+        rate_of_success, rate_of_failure = SmsStats.rates(self.total_sms_sent, self.total_sms_failed)
+        return {
+            "bucketStart": self.bucket_start.isoformat(),
+            "totalSmsSent": self.total_sms_sent,
+            "totalSmsFailed": self.total_sms_failed,
+            "rateOfSuccess": rate_of_success,
+            "rateOfFailure": rate_of_failure
+        }
+
+
+# Which stored number list holds each number, for SMS_DEDUP_ACROSS_PAIRS
+class PairNumbers:
+    """One document {_id: number, file_id} per number of the stored lists.
+
+    Uploads claim their numbers in batches while they are written, so checking
+    a list against every other pair costs one insert per batch instead of
+    reading the other lists back. The unique _id gives each number to the
+    first list that claims it, also when uploads run at the same time.
+    """
+
+    collection = db_mongo["pair_numbers"]  # index on file_id comes from indexes.py
+
+    @classmethod
+    def claim(cls, numbers, file_id, replaces=None):
+        """Claim a batch of unique numbers for the list `file_id`; returns the ones another list holds.
+
+        Numbers held by the list `replaces` move over to the new list.
+        """
+        try:
+            cls.collection.insert_many([{"_id": number, "file_id": file_id} for number in numbers], ordered=False)
+            return set()
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            taken = [numbers[error["index"]] for error in errors]
+        
+        if replaces is not None:
+            cls.collection.update_many(
+                {"_id": {"$in": taken}, "file_id": replaces},
+                {"$set": {"file_id": file_id}}
+            )
+        held = {
+            doc["_id"] for doc in cls.collection.find({"_id": {"$in": taken}, "file_id": file_id}, {"_id": 1})
+        }
+        return set(taken) - held
+
+    @classmethod
+    def move(cls, file_id, to_file_id):
+        """Give the numbers of one list to another, e.g. back to the list a failed replacement was for"""
+        cls.collection.update_many({"file_id": file_id}, {"$set": {"file_id": to_file_id}})
+
+    @classmethod
+    def release(cls, file_id):
+        """Free the numbers of a deleted list"""
+        cls.collection.delete_many({"file_id": file_id})
+
+
 # MongoDB Model 1
 class MongoPair:
     collection = db_mongo["pairs"]  # MongoDB collection name
+    files = GridFSBucket(db_mongo, bucket_name="number_lists")  # uploaded number lists
+    
+    # Leaves out number lists that older documents still store inline
+    PROJECTION = {"number_list_file.content": 0}
+    
+    # Only the fields to_json needs, for listing pairs
+    LIST_PROJECTION = {
+        "pair_name": 1,
+        "active_status": 1,
+        "priority": 1,
+        "proxy": 1,
+        "proxies": 1,
+        "proxy_routing": 1,
+        "rate_limit": 1,
+        "session_details": 1,
+        "created_at": 1,
+        "number_list_file.filename": 1,
+        "number_list_file.upload_date": 1,
+        "number_list_file.content_type": 1,
+        "number_list_file.stats": 1
+    }
 
     @staticmethod
     def to_json(document):
@@ -47,56 +192,271 @@ class MongoPair:
             "activeStatus": document.get("active_status"),
             "priority": document.get("priority"),
             "proxy": document.get("proxy"),
+            "proxies": document.get("proxies"),
+            "proxyRouting": document.get("proxy_routing"),
+            "rateLimit": document.get("rate_limit"),
             "sessionDetails": document.get("session_details"),
             "createdAt": document.get("created_at"),
             "numberListFile": {
                 "filename": file_info.get("filename"),
                 "upload_date": file_info.get("upload_date"),
-                "content_type": file_info.get("content_type")
+                "content_type": file_info.get("content_type"),
+                "stats": file_info.get("stats")
             } if file_info else None
         }
 
+    @staticmethod
+    def parse_proxies(value):
+        """Normalize a proxy pool to [{"proxy": ..., "weight": n}].
+
+        Accepts a list or a JSON array of "host:port" strings or
+        {"proxy", "weight"} objects, or comma separated "host:port" text.
+        Raises ValueError on an empty pool or a bad weight.
+        """
+        if isinstance(value, str):
+            value = value.strip()
+            value = json.loads(value) if value.startswith("[") else value.split(",")
+        
+        proxies = []
+        for entry in value or []:
+            if isinstance(entry, str):
+                entry = {"proxy": entry}
+            elif not isinstance(entry, dict):
+                raise ValueError("Proxies must be host:port strings or {proxy, weight} objects")
+            proxy = str(entry.get("proxy") or "").strip()
+            weight = int(entry.get("weight") or 1)
+            if weight <= 0:
+                raise ValueError("Proxy weights must be positive numbers")
+            if proxy:
+                proxies.append({"proxy": proxy, "weight": weight})
+        if not proxies:
+            raise ValueError("proxies must name at least one proxy")
+        return proxies
+
+    @staticmethod
+    def parse_routing(value):
+        if value not in ROUTINGS:
+            raise ValueError(f"proxy_routing must be one of: {', '.join(ROUTINGS)}")
+        return value
+
+    @staticmethod
+    def proxy_pool(document):
+        """[(proxy, weight)] a pair sends through; pairs without a pool use their single proxy"""
+        proxies = document.get("proxies")
+        if proxies:
+            return [(entry["proxy"], entry.get("weight", 1)) for entry in proxies]
+        return [(document.get("proxy"), 1)]
+
     @classmethod
     def insert_one(cls, pair_name, active_status, priority, session_details, 
-                  proxy, number_list_file=None):
+                  proxy, number_list_file=None, rate_limit=None, proxies=None, proxy_routing=None):
         data = {
             "pair_name": pair_name,
             "active_status": active_status,
-            "proxy": proxy,
+            "proxy": proxy or (proxies[0]["proxy"] if proxies else None),
+            "proxies": proxies,
+            "proxy_routing": proxy_routing,
             "priority": priority,
+            "rate_limit": rate_limit,
             "session_details": session_details,
             "created_at": datetime.utcnow()
         }
         
         if number_list_file:
-            data["number_list_file"] = {
-                "filename": number_list_file.get("filename"),
-                "content": Binary(number_list_file.get("content")),
-                "content_type": number_list_file.get("content_type"),
-                "upload_date": datetime.utcnow()
-            }
+            data["number_list_file"] = cls.upload_number_list(
+                pair_name,
+                number_list_file.get("filename"),
+                number_list_file.get("stream"),
+                number_list_file.get("content_type")
+            )
         
-        result = cls.collection.insert_one(data)
-        return result.inserted_id
+        try:
+            cls.collection.insert_one(data)
+        except Exception:
+            if number_list_file:
+                try:
+                    cls.delete_file(data["number_list_file"])
+                except Exception as e:
+                    print(f"Failed to remove number list of {pair_name}: {e}")
+            raise
+        return data  # now holds the generated _id
+
+    @classmethod
+    def upload_number_list(cls, pair_name, filename, stream, content_type, replaces=None):
+        """Normalize and deduplicate an uploaded list, then store it in GridFS.
+
+        The stored list is packed (see number_reader.write_packed) so starting
+        or resuming a pair needs no parsing; the returned reference carries the upload stats (total/invalid/duplicates/unique).
+        With SMS_DEDUP_ACROSS_PAIRS the list claims its numbers in PairNumbers,
+        taking over those of the list `replaces` (a file_id).
+        Raises ValueError when no valid number is left.
+        """
+        stats = new_stats()
+        stored_name = f"{filename.rsplit('.', 1)[0]}.{PACKED_EXTENSION}"
+        with cls.files.open_upload_stream(
+            stored_name,
+            chunk_size_bytes=FILE_CHUNK_SIZE,
+            metadata={"pair_name": pair_name, "content_type": PACKED_CONTENT_TYPE, "original_filename": filename}
+        ) as grid_in:
+            exclude = None
+            if DEDUP_ACROSS_PAIRS:
+                exclude = lambda batch: PairNumbers.claim(batch, grid_in._id, replaces)
+            try:
+                write_packed(grid_in, dedupe(normalize_all(iter_numbers(stream, filename), stats), stats, exclude))
+            except Exception:
+                if DEDUP_ACROSS_PAIRS:
+                    cls._restore_claims(grid_in._id, replaces)
+                raise
+        
+        if not stats["unique"]:
+            try:
+                cls.files.delete(grid_in._id)
+            except Exception as e:
+                print(f"Failed to remove number list of {pair_name}: {e}")
+            raise ValueError("The number list has no valid phone numbers")
+        
+        return {
+            "file_id": grid_in._id,
+            "filename": stored_name,
+            "original_filename": filename,
+            "content_type": PACKED_CONTENT_TYPE,
+            "length": grid_in.length,
+            "stats": stats,
+            "upload_date": datetime.utcnow()
+        }
+
+    @staticmethod
+    def _restore_claims(file_id, replaces):
+        """Undo the claims of a list that was not stored"""
+        try:
+            if replaces is not None:
+                PairNumbers.move(file_id, replaces)
+            else:
+                PairNumbers.release(file_id)
+        except Exception as e:
+            print(f"Failed to release numbers of list {file_id}: {e}")
+
+    @classmethod
+    def index_number_lists(cls):
+        """Claim the numbers of stored lists in PairNumbers, for lists uploaded
+        while SMS_DEDUP_ACROSS_PAIRS was off. Lists with claims are skipped.
+        """
+        indexed = 0
+        for pair in cls.collection.find(
+            {"number_list_file.file_id": {"$exists": True}},
+            {"pair_name": 1, "number_list_file": 1}
+        ):
+            file_info = pair["number_list_file"]
+            file_id = file_info["file_id"]
+            if PairNumbers.collection.find_one({"file_id": file_id}, {"_id": 1}):
+                continue
+            filename = file_info.get("filename", "")
+            with cls.open_file(pair["pair_name"], file_info) as stream:
+                numbers = iter_packed(stream) if is_packed(filename) else normalize_all(iter_numbers(stream, filename), new_stats())
+                for _ in dedupe(numbers, new_stats(), lambda batch: PairNumbers.claim(batch, file_id), mode="exact"):
+                    pass
+            indexed += 1
+        return indexed
+
+    @classmethod
+    def open_file(cls, pair_name, file_info):
+        """Open the number list of a pair as a binary file object read in chunks"""
+        if "file_id" in file_info:
+            return cls.files.open_download_stream(file_info["file_id"])
+        
+        # Documents from before GridFS keep the list inline
+        pair = cls.collection.find_one(
+            {"pair_name": pair_name},
+            {"number_list_file.content": 1}
+        )
+        return io.BytesIO(pair["number_list_file"]["content"])
+
+    @classmethod
+    def delete_file(cls, file_info):
+        if file_info and "file_id" in file_info:
+            cls.files.delete(file_info["file_id"])
+            PairNumbers.release(file_info["file_id"])
 
     @classmethod
     def get_file_content(cls, pair_name):
-        pair = cls.collection.find_one({"pair_name": pair_name})
+        pair = cls.collection.find_one({"pair_name": pair_name}, cls.PROJECTION)
         if pair and "number_list_file" in pair:
+            file_info = pair["number_list_file"]
+            with cls.open_file(pair_name, file_info) as stream:
+                content = stream.read()
             return {
-                "content": pair["number_list_file"]["content"],
-                "filename": pair["number_list_file"]["filename"],
-                "content_type": pair["number_list_file"]["content_type"]
+                "content": content,
+                "filename": file_info["filename"],
+                "content_type": file_info["content_type"]
             }
         return None
 
+    @classmethod
+    def migrate_inline_files(cls):
+        """Move number lists stored inline in pair documents into GridFS, packed"""
+        migrated = 0
+        for pair in cls.collection.find(
+            {"number_list_file.content": {"$exists": True}},
+            {"pair_name": 1, "number_list_file": 1}
+        ):
+            file_info = pair["number_list_file"]
+            if cls._replace_number_list(pair, io.BytesIO(file_info["content"]), {"number_list_file.content": {"$exists": True}}):
+                migrated += 1
+        return migrated
+
+    @classmethod
+    def pack_number_lists(cls):
+        """Convert number lists in GridFS that predate the packed format.
+
+        Pairs restart from the top of the converted list, so run this while
+        they are stopped.
+        """
+        packed = 0
+        for pair in cls.collection.find(
+            {"number_list_file.file_id": {"$exists": True}},
+            {"pair_name": 1, "number_list_file": 1}
+        ):
+            file_info = pair["number_list_file"]
+            if is_packed(file_info.get("filename", "")):
+                continue
+            with cls.open_file(pair["pair_name"], file_info) as stream:
+                replaced = cls._replace_number_list(pair, stream, {"number_list_file.file_id": file_info["file_id"]})
+            if replaced:
+                cls.delete_file(file_info)
+                packed += 1
+        return packed
+
+    @classmethod
+    def _replace_number_list(cls, pair, stream, unchanged):
+        """Store `stream` as the packed list of `pair` if its list still matches `unchanged`"""
+        file_info = pair["number_list_file"]
+        try:
+            reference = cls.upload_number_list(
+                pair["pair_name"],
+                file_info.get("filename", ""),
+                stream,
+                file_info.get("content_type"),
+                replaces=file_info.get("file_id")
+            )
+        except ValueError as e:
+            print(f"Skipped number list of {pair['pair_name']}: {e}")
+            return False
+        reference["upload_date"] = file_info.get("upload_date", reference["upload_date"])
+        
+        result = cls.collection.update_one(
+            {"_id": pair["_id"], **unchanged},
+            {"$set": {"number_list_file": reference}}
+        )
+        if not result.modified_count:
+            if DEDUP_ACROSS_PAIRS:
+                cls._restore_claims(reference["file_id"], file_info.get("file_id"))
+            cls.files.delete(reference["file_id"])
+        return bool(result.modified_count)
+
 
 # MongoDB Model 2 for User
 class User:
-    collection = db_mongo["users"] 
-
-    collection.create_index("username", unique=True)
-    collection.create_index("email", unique=True)
+    collection = db_mongo["users"]  # unique indexes on username/email come from indexes.py
 
     @staticmethod
     def to_json(document):
@@ -108,21 +468,21 @@ class User:
 
     @classmethod
     def insert_one(cls, username, password, email):
-        # Check if username or email already exists
-        if cls.collection.find_one({"username": username}):
-            raise ValueError("Username already exists")
-            
-        if cls.collection.find_one({"email": email}):
-            raise ValueError("Email already exists")
-
         data = {
             "username": username,
             "password": password,
             "email": email
         }
         
+        # The unique indexes on username and email reject duplicates, so no
+        # lookups are needed before the insert
         try:
             result = cls.collection.insert_one(data)
             return result.inserted_id
-        except DuplicateKeyError:
-            raise ValueError("Duplicate key error: Username or email must be unique")
\ No newline at end of file
+        except DuplicateKeyError as e:
+            key_pattern = (e.details or {}).get("keyPattern") or {}
+            if "username" in key_pattern or "username" in str(e):
+                raise ValueError("Username already exists")
+            if "email" in key_pattern or "email" in str(e):
+                raise ValueError("Email already exists")
+            raise ValueError("Duplicate key error: Username or email must be unique")
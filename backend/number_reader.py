@@ -0,0 +1,134 @@
+# number_reader.py
+
+import csv
+import struct
+import sys
+from array import array
+
+PHONE_COLUMN = "phone_number"
+
+# Packed number lists: a 16 byte header, then one little-endian uint64
+# (E.164 digits) per number, so number i starts at PACKED_HEADER.size + 8 * i
+PACKED_EXTENSION = "bin"
+PACKED_CONTENT_TYPE = "application/x-sms-numbers"
+PACKED_MAGIC = b"SMSN"
+PACKED_VERSION = 1
+PACKED_HEADER = struct.Struct("<4sHH8x")  # magic, version, record width
+PACKED_CHUNK = 65536  # numbers per read/write
+
+
+def iter_numbers(stream, filename, column=PHONE_COLUMN):
+    """Yield phone numbers from a binary file object one at a time.
+
+    Supports .csv, .xlsx and plain text (one number per line). For csv/xlsx
+    the `column` header is used when present, otherwise the first column.
+    Nothing beyond the current row is kept in memory.
+    """
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if extension == PACKED_EXTENSION:
+        for number in iter_packed(stream):
+            yield f"+{number}"
+        return
+    if extension == "xlsx":
+        rows = _iter_xlsx_rows(stream)
+    elif extension == "csv":
+        rows = csv.reader(_iter_lines(stream))
+    else:
+        rows = ([line] for line in _iter_lines(stream))
+
+    for number in _iter_column(rows, column):
+        yield number
+
+
+def is_packed(filename):
+    return filename.lower().endswith(f".{PACKED_EXTENSION}")
+
+
+def write_packed(stream, numbers):
+    """Write ints to a binary file object in the packed format; returns how many were written"""
+    stream.write(PACKED_HEADER.pack(PACKED_MAGIC, PACKED_VERSION, 8))
+    written = 0
+    chunk = array("Q")
+    for number in numbers:
+        chunk.append(number)
+        if len(chunk) >= PACKED_CHUNK:
+            written += _write_chunk(stream, chunk)
+            chunk = array("Q")
+    if chunk:
+        written += _write_chunk(stream, chunk)
+    return written
+
+
+def _write_chunk(stream, chunk):
+    if sys.byteorder == "big":
+        chunk.byteswap()
+    stream.write(chunk.tobytes())
+    return len(chunk)
+
+
+def iter_packed(stream, start=0):
+    """Yield the numbers (ints) of a packed list, beginning at index `start`.
+
+    Seeks straight to `start` and reads PACKED_CHUNK numbers at a time, so
+    resuming costs nothing and only one chunk is held in memory.
+    """
+    magic, version, width = PACKED_HEADER.unpack(stream.read(PACKED_HEADER.size))
+    if magic != PACKED_MAGIC or version != PACKED_VERSION or width != 8:
+        raise ValueError("Not a packed number list")
+    if start:
+        stream.seek(PACKED_HEADER.size + 8 * start)
+
+    while True:
+        data = stream.read(8 * PACKED_CHUNK)
+        if not data:
+            break
+        chunk = array("Q")
+        chunk.frombytes(data[:len(data) - len(data) % 8])
+        if sys.byteorder == "big":
+            chunk.byteswap()
+        yield from chunk
+
+
+def _iter_lines(stream):
+    for raw in stream:
+        yield raw.decode("utf-8-sig")
+
+
+def _iter_xlsx_rows(stream):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _iter_column(rows, column):
+    index = 0
+    for row in rows:
+        if not row:
+            continue
+        header = [_cell_text(cell).lower() for cell in row]
+        if column in header:
+            index = header.index(column)
+        else:
+            # No header row, the first row already holds a number
+            if header[0]:
+                yield _cell_text(row[0])
+        break
+
+    for row in rows:
+        if len(row) > index:
+            value = _cell_text(row[index])
+            if value:
+                yield value
@@ -0,0 +1,49 @@
+# passwords.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Raised when too many hash operations are already queued"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool.
+
+    bcrypt releases the GIL while hashing, so at most `workers` hashes burn
+    CPU at a time while request threads for other routes keep running. At
+    most `max_queued` further operations may wait; beyond that callers get
+    HasherBusy right away instead of piling up behind a login burst.
+    """
+
+    def __init__(self, workers=None, max_queued=None, rounds=None, timeout=None):
+        self.workers = workers or int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_queued = max_queued if max_queued is not None else int(os.getenv("BCRYPT_MAX_QUEUED", "32"))
+        self.rounds = rounds or int(os.getenv("BCRYPT_ROUNDS", "12"))
+        self.timeout = timeout or float(os.getenv("BCRYPT_TIMEOUT", "10"))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._slots = BoundedSemaphore(self.workers + self.max_queued)
+
+    def hash(self, password):
+        """bcrypt hash of `password` as a str"""
+        hashed = self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+        return hashed.decode('utf-8')
+
+    def check(self, password, hashed):
+        """True when `password` matches the stored hash"""
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("Too many sign-in requests, try again shortly")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(timeout=self.timeout)
@@ -0,0 +1,189 @@
+# phone_numbers.py
+
+import heapq
+import math
+import os
+import re
+from array import array
+
+DEFAULT_COUNTRY_CODE = os.getenv("SMS_DEFAULT_COUNTRY_CODE", "91")
+NATIONAL_NUMBER_LENGTH = int(os.getenv("SMS_NATIONAL_NUMBER_LENGTH", "10"))
+DEDUP_MODE = os.getenv("SMS_DEDUP_MODE", "exact")  # exact | bloom
+DEDUP_ACROSS_PAIRS = os.getenv("SMS_DEDUP_ACROSS_PAIRS", "false").lower() == "true"
+RUN_SIZE = 1_000_000  # numbers sorted at a time in exact mode
+EXCLUDE_BATCH = 10_000  # unique numbers checked against other pairs at a time
+
+_SEPARATORS = re.compile(r"[\s\-().]")
+
+
+def normalize(raw, country_code=DEFAULT_COUNTRY_CODE):
+    """E.164 digits of a phone number as an int, or None when it is not valid.
+
+    Accepts +<cc>..., 00<cc>..., national numbers with a trunk 0 and bare
+    national numbers (which get `country_code`), with any spaces, dashes,
+    dots or brackets in between.
+    """
+    text = _SEPARATORS.sub("", str(raw))
+    if text.startswith("+"):
+        digits = text[1:]
+    elif text.startswith("00"):
+        digits = text[2:]
+    elif text.startswith("0"):
+        digits = country_code + text[1:]
+    elif len(text) == NATIONAL_NUMBER_LENGTH:
+        digits = country_code + text
+    else:
+        digits = text
+
+    if not (digits.isascii() and digits.isdigit()) or not 8 <= len(digits) <= 15 or digits[0] == "0":
+        return None
+    return int(digits)
+
+
+def format_number(number):
+    return f"+{number}"
+
+
+def new_stats():
+    return {"total": 0, "invalid": 0, "duplicates": 0, "cross_pair_duplicates": 0, "unique": 0}
+
+
+def normalize_all(raw_numbers, stats):
+    """Normalize a stream of raw numbers, counting rows and invalid ones in `stats`"""
+    for raw in raw_numbers:
+        stats["total"] += 1
+        number = normalize(raw)
+        if number is None:
+            stats["invalid"] += 1
+        else:
+            yield number
+
+
+def dedupe(numbers, stats, exclude=None, mode=None):
+    """Unique numbers of an int stream, dropping any that `exclude` rejects.
+
+    "exact" mode keeps the numbers as sorted int64 runs (8 bytes per number)
+    and merges them, yielding the list in ascending order. "bloom" mode keeps
+    the upload order and uses a fixed size Bloom filter, for lists too large
+    to hold; it may drop a few unique numbers as false positives.
+
+    `exclude(batch)` gets lists of up to EXCLUDE_BATCH unique numbers and
+    returns the ones to drop as cross-pair duplicates (see PairNumbers.claim).
+    """
+    mode = mode or DEDUP_MODE
+    if mode == "bloom":
+        return _dedupe_bloom(numbers, stats, exclude)
+    return _dedupe_exact(numbers, stats, exclude)
+
+
+def _sorted_runs(numbers):
+    run = array("q")
+    for number in numbers:
+        run.append(number)
+        if len(run) >= RUN_SIZE:
+            yield array("q", sorted(run))
+            run = array("q")
+    if run:
+        yield array("q", sorted(run))
+
+
+def _merge_unique(runs):
+    previous = None
+    for number in heapq.merge(*runs):
+        if number != previous:
+            previous = number
+            yield number
+
+
+def _batches(numbers, size=EXCLUDE_BATCH):
+    batch = []
+    for number in numbers:
+        batch.append(number)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _dedupe_exact(numbers, stats, exclude):
+    runs = list(_sorted_runs(numbers))
+    read = sum(len(run) for run in runs)
+    unique = _merge_unique(runs)
+
+    if exclude is None:
+        for number in unique:
+            stats["unique"] += 1
+            yield number
+    else:
+        for batch in _batches(unique):
+            excluded = exclude(batch)
+            for number in batch:
+                if number in excluded:
+                    stats["cross_pair_duplicates"] += 1
+                    continue
+                stats["unique"] += 1
+                yield number
+    stats["duplicates"] = read - stats["unique"] - stats["cross_pair_duplicates"]
+
+
+def _dedupe_bloom(numbers, stats, exclude):
+    seen = BloomFilter()
+    if exclude is None:
+        for number in numbers:
+            if seen.add(number):
+                stats["duplicates"] += 1
+            else:
+                stats["unique"] += 1
+                yield number
+        return
+
+    for batch in _batches(numbers):
+        fresh = [number for number in batch if not seen.add(number)]
+        stats["duplicates"] += len(batch) - len(fresh)
+        excluded = exclude(fresh) if fresh else ()
+        for number in fresh:
+            if number in excluded:
+                stats["cross_pair_duplicates"] += 1
+            else:
+                stats["unique"] += 1
+                yield number
+
+
+class BloomFilter:
+    """Set membership for ints in a fixed bit array, with false positives at `error_rate`"""
+
+    def __init__(self, capacity=None, error_rate=None):
+        capacity = capacity or int(os.getenv("SMS_BLOOM_CAPACITY", "10000000"))
+        error_rate = error_rate or float(os.getenv("SMS_BLOOM_ERROR_RATE", "0.001"))
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, number):
+        h = _mix64(number)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, number):
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(number))
+
+    def add(self, number):
+        """Add a number; True if it was (probably) there already"""
+        bits = self._bits
+        present = True
+        for p in self._positions(number):
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask
+                present = False
+        return present
+
+
+def _mix64(x):
+    # splitmix64 finalizer, spreads consecutive numbers over the whole range
+    x = (x + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
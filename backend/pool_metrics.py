@@ -0,0 +1,154 @@
+# pool_metrics.py
+
+import time
+from threading import Lock, local
+
+from pymongo import monitoring
+
+
+class PoolStats:
+    """Checkout counters shared by the SQL and MongoDB pool probes"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.checked_out = 0
+        self.waiting = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.opened = 0
+        self.closed = 0
+
+    def wait_started(self):
+        with self._lock:
+            self.waiting += 1
+
+    def wait_ended(self, seconds, acquired):
+        with self._lock:
+            self.waiting -= 1
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            if acquired:
+                self.checked_out += 1
+            else:
+                self.timeouts += 1
+
+    def released(self):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_opened(self):
+        with self._lock:
+            self.opened += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.closed += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "checkouts": self.waits,
+                "avg_wait_ms": round(self.wait_seconds / self.waits * 1000, 3) if self.waits else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+                "timeouts": self.timeouts,
+                "connections_opened": self.opened,
+                "connections_closed": self.closed,
+            }
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """pymongo pool listener; pass it to MongoClient(event_listeners=[...])"""
+
+    def __init__(self):
+        self.stats = PoolStats()
+        self.options = {}
+        self._started = local()  # checkout events fire on the thread that asks for the connection
+
+    def connection_check_out_started(self, event):
+        self._started.at = time.perf_counter()
+        self.stats.wait_started()
+
+    def connection_checked_out(self, event):
+        self.stats.wait_ended(time.perf_counter() - self._started.at, acquired=True)
+
+    def connection_check_out_failed(self, event):
+        self.stats.wait_ended(time.perf_counter() - self._started.at, acquired=False)
+
+    def connection_checked_in(self, event):
+        self.stats.released()
+
+    def connection_created(self, event):
+        self.stats.connection_opened()
+
+    def connection_closed(self, event):
+        self.stats.connection_closed()
+
+    def pool_created(self, event):
+        self.options = dict(event.options)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self):
+        return {**self.stats.snapshot(), "options": self.options}
+
+
+class SQLPoolMetrics:
+    """Times checkouts from a SQLAlchemy pool.
+
+    The pool has no event for a checkout that has to wait, so `attach`
+    wraps the engine's pool.connect to time each call; checkins and new or
+    closed connections come from the pool events.
+    """
+
+    def __init__(self):
+        self.stats = PoolStats()
+        self._pool = None
+
+    def attach(self, engine):
+        from sqlalchemy import event
+
+        pool = self._pool = engine.pool
+        stats = self.stats
+        connect = pool.connect
+
+        def timed_connect():
+            stats.wait_started()
+            started = time.perf_counter()
+            try:
+                connection = connect()
+            except Exception:
+                stats.wait_ended(time.perf_counter() - started, acquired=False)
+                raise
+            stats.wait_ended(time.perf_counter() - started, acquired=True)
+            return connection
+
+        pool.connect = timed_connect
+        event.listen(pool, "checkin", lambda *args: stats.released())
+        event.listen(pool, "connect", lambda *args: stats.connection_opened())
+        event.listen(pool, "close", lambda *args: stats.connection_closed())
+
+    def snapshot(self):
+        snapshot = self.stats.snapshot()
+        pool = self._pool
+        if pool is not None and hasattr(pool, "size"):
+            snapshot["options"] = {
+                "pool_size": pool.size(),
+                "overflow": pool.overflow(),
+                "timeout": pool.timeout(),
+            }
+        return snapshot
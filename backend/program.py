@@ -1,20 +1,48 @@
-from urllib import response
+import os
+
+GATEWAY_URL = os.getenv("SMS_GATEWAY_URL", "http://127.0.0.1:8000").rstrip("/")
+
+
+def proxy_url(proxy):
+    """Turn a stored proxy like host:port into a URL aiohttp accepts"""
+    if not proxy:
+        return None
+    return proxy if "://" in proxy else f"http://{proxy}"
+
 
 class SendSMS:
-    def init(self,phone_number,proxy):
+    def __init__(self, phone_number, proxy, session):
         self.phone_number = phone_number
         self.proxy = proxy
+        self.session = session
 
-    def SendOtp(self):
+    async def SendOtp(self):
         # this function sends message on the phone number using that proxy
-        if 'sent successfully' in response.text:
+        async with self.session.post(
+            f"{GATEWAY_URL}/send",
+            json={"phone_number": str(self.phone_number)},
+            proxy=proxy_url(self.proxy)
+        ) as response:
+            text = await response.text()
+        if 'sent successfully' in text:
             return True
         else:
             return False
+
 class SubmitSMS:
-    def SumitOtp(self,trigger_id,SMS_code):
+    def __init__(self, proxy, session):
+        self.proxy = proxy
+        self.session = session
+
+    async def SumitOtp(self, trigger_id, SMS_code):
         # submits the SMS_code
-        if 'submitted successfully' in response.text:
+        async with self.session.post(
+            f"{GATEWAY_URL}/submit",
+            json={"trigger_id": trigger_id, "sms_code": SMS_code},
+            proxy=proxy_url(self.proxy)
+        ) as response:
+            text = await response.text()
+        if 'submitted successfully' in text:
             return True
         else:
-            return False
\ No newline at end of file
+            return False
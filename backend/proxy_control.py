@@ -0,0 +1,293 @@
+# proxy_control.py
+
+import os
+import time
+from collections import deque
+from threading import Lock
+
+CLOSED = "closed"        # sending normally
+OPEN = "open"            # failing, nothing is sent until the next probe
+HALF_OPEN = "half_open"  # one probe send in flight decides whether to close again
+
+# Returned by try_acquire when the proxy is at its concurrency limit; the
+# caller was added to the waiters and is woken when a send completes.
+FULL = object()
+
+# How a pair with several proxies picks one for each send
+LEAST_LOADED = "least_loaded"  # the proxy with the most spare capacity, relative to its weight
+WEIGHTED = "weighted"          # smooth weighted round robin, skipping full or failing proxies
+ROUTINGS = (LEAST_LOADED, WEIGHTED)
+
+
+class ProxyController:
+    """Adaptive concurrency limit and circuit breaker for one proxy.
+
+    The limit grows by about one send per round trip while sends succeed
+    quickly and is cut by `decrease` when a send fails with an error or takes
+    longer than `slow_factor` times the fastest send seen (additive increase,
+    multiplicative decrease). At most one cut happens per round trip, so a
+    burst of timeouts from one congestion event only halves the limit once.
+
+    When at least `failure_ratio` of the last `window` sends failed, the
+    breaker opens: nothing is sent until a single probe after `backoff`
+    seconds, which doubles after every failed probe up to `max_backoff`.
+    """
+
+    def __init__(self, proxy, initial=None, max_limit=None, decrease=None, slow_factor=None,
+                 slow_floor=None, window=None, failure_ratio=None, backoff=None, max_backoff=None):
+        self.proxy = proxy
+        self.initial = initial or float(os.getenv("SMS_PROXY_INITIAL_CONCURRENCY", "4"))
+        self.max_limit = max_limit or float(
+            os.getenv("SMS_PROXY_MAX_CONCURRENCY", os.getenv("SMS_CONNECTIONS_PER_PROXY", "32"))
+        )
+        self.decrease = decrease or float(os.getenv("SMS_PROXY_DECREASE", "0.5"))
+        self.slow_factor = slow_factor or float(os.getenv("SMS_PROXY_SLOW_FACTOR", "4"))
+        self.slow_floor = slow_floor or float(os.getenv("SMS_PROXY_SLOW_SECONDS", "0.5"))
+        self.window = window or int(os.getenv("SMS_BREAKER_WINDOW", "20"))
+        self.failure_ratio = failure_ratio or float(os.getenv("SMS_BREAKER_FAILURE_RATIO", "0.5"))
+        self.backoff = backoff or float(os.getenv("SMS_BREAKER_BACKOFF", "1"))
+        self.max_backoff = max_backoff or float(os.getenv("SMS_BREAKER_MAX_BACKOFF", "60"))
+
+        self.limit = self.initial
+        self.in_flight = 0
+        self.state = CLOSED
+        self.trips = 0  # consecutive failed probes
+        self.opened = 0  # times the breaker opened
+        self.retry_at = 0.0
+        self._outcomes = deque(maxlen=self.window)
+        self._failures = 0
+        self._min_latency = None
+        self._last_decrease = 0.0
+        self._waiters = {}  # insertion ordered, so waiters are woken first come first served
+        self._lock = Lock()
+
+    def try_acquire(self, waiter=None, now=None):
+        """Reserve one send.
+
+        Returns 0 when the send may go ahead, FULL when the proxy is at its
+        limit (`waiter` is woken once a slot frees up), or the number of
+        seconds until the breaker lets a probe through.
+        """
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            if self.state == OPEN and now < self.retry_at:
+                return self.retry_at - now
+            # Half open admits a single probe, once the sends from before the breaker opened are back
+            busy = self.in_flight if self.state != CLOSED else self.in_flight >= int(self.limit)
+            if busy:
+                if waiter is not None:
+                    self._waiters[waiter] = None
+                return FULL
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+            self.in_flight += 1
+            return 0.0
+
+    def release(self, latency=None, ok=True, error=False, now=None):
+        """Give a slot back with the outcome of its send; returns the waiters to wake.
+
+        `ok` is whether the gateway accepted the send and `error` whether it
+        raised (timeout, connection or proxy failure). Without a latency the
+        slot was not used and nothing is learned from it.
+        """
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            self.in_flight -= 1
+            if latency is not None:
+                self._learn(latency, ok, error, now)
+            if self.state != CLOSED or not self.in_flight:
+                # Every waiter looks again: to see the breaker state, or because no send is left to wake them
+                waiters, self._waiters = list(self._waiters), {}
+            else:
+                waiters = []
+                for _ in range(min(len(self._waiters), int(self.limit) - self.in_flight)):
+                    waiter = next(iter(self._waiters))
+                    del self._waiters[waiter]
+                    waiters.append(waiter)
+        return waiters
+
+    def discard_waiter(self, waiter):
+        """Forget a waiter; True if it was waiting"""
+        with self._lock:
+            return self._waiters.pop(waiter, False) is None
+
+    def _learn(self, latency, ok, error, now):
+        if self.state == OPEN:
+            return  # a send from before the breaker opened
+        if self.state == HALF_OPEN:
+            if ok and not error:
+                self._close()
+            else:
+                self._open(now)
+            return
+
+        if len(self._outcomes) == self._outcomes.maxlen and not self._outcomes[0]:
+            self._failures -= 1
+        self._outcomes.append(ok and not error)
+        if not (ok and not error):
+            self._failures += 1
+        if self._failures >= self.failure_ratio * self.window:
+            self._open(now)
+            return
+
+        if not error:
+            self._min_latency = latency if self._min_latency is None else min(self._min_latency, latency)
+        slow = latency > max(self.slow_floor, self.slow_factor * (self._min_latency or 0))
+        if error or slow:
+            if now - self._last_decrease >= latency:
+                self.limit = max(1.0, self.limit * self.decrease)
+                self._last_decrease = now
+        elif self.in_flight + 1 >= int(self.limit) // 2:
+            # Only grow while the current limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened += 1
+        self.retry_at = now + min(self.max_backoff, self.backoff * 2 ** self.trips)
+        self.trips += 1
+        self.limit = 1.0
+
+    def _close(self):
+        self.state = CLOSED
+        self.trips = 0
+        self._outcomes.clear()
+        self._failures = 0
+        self._min_latency = None
+        self.limit = self.initial
+
+    def load(self):
+        """Share of the limit in use; read without the lock, good enough for routing"""
+        if self.state != CLOSED:
+            return float("inf")
+        return self.in_flight / self.limit
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "recent_failures": self._failures,
+                "breaker_opened": self.opened,
+                "retry_in": round(max(0.0, self.retry_at - time.monotonic()), 2) if self.state == OPEN else 0.0,
+            }
+
+
+class ProxyControllerRegistry:
+    """One ProxyController per proxy, shared by every pair that sends through it.
+
+    Sends without a proxy go straight to the gateway and share the "" controller.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._controllers = {}
+        self._lock = Lock()
+
+    def get(self, proxy):
+        """The controller of `proxy`, or None when proxy control is turned off"""
+        if not self.enabled:
+            return None
+        key = proxy or ""
+        with self._lock:
+            controller = self._controllers.get(key)
+            if controller is None:
+                controller = self._controllers[key] = ProxyController(key)
+            return controller
+
+    def snapshot(self):
+        with self._lock:
+            controllers = list(self._controllers.items())
+        return {proxy or "direct": controller.snapshot() for proxy, controller in controllers}
+
+    def sample(self, field):
+        """{(proxy,): value} of one snapshot field, for a metrics gauge"""
+        value = {"breaker_open": lambda s: int(s["state"] == OPEN)}.get(field, lambda s: s[field])
+        return {(proxy,): value(snapshot) for proxy, snapshot in self.snapshot().items()}
+
+
+class ProxyRoute:
+    """One proxy of a pair's pool"""
+
+    def __init__(self, proxy, weight, controller):
+        self.proxy = proxy
+        self.weight = weight
+        self.controller = controller
+        self.in_flight = 0  # this pair's sends through the proxy
+        self.current = 0    # smooth weighted round robin credit
+
+    def load(self):
+        if self.controller is not None:
+            return self.controller.load() / self.weight
+        return self.in_flight / self.weight
+
+
+class ProxyPool:
+    """The proxies one pair sends through, and which one each send takes.
+
+    Numbers are handed out one at a time from the pair's single list, so the
+    list is sharded over the proxies as fast as each can take them: a slow or
+    failing proxy takes fewer numbers instead of stranding a fixed share of
+    the list, and the pair keeps one rate limit, one checkpoint and one set
+    of stats.
+    """
+
+    def __init__(self, proxies, controllers, routing=None):
+        self.routes = [ProxyRoute(proxy, weight, controllers.get(proxy)) for proxy, weight in proxies]
+        self.routing = routing or LEAST_LOADED
+        self._total_weight = sum(route.weight for route in self.routes)
+        self._lock = Lock()
+
+    def _candidates(self):
+        if len(self.routes) == 1:
+            return self.routes
+        if self.routing == WEIGHTED:
+            return sorted(self.routes, key=lambda route: -(route.current + route.weight))
+        return sorted(self.routes, key=ProxyRoute.load)
+
+    def acquire(self, waiter):
+        """Pick a proxy for one send.
+
+        Returns (route, 0), or (None, FULL) when every proxy is at its limit
+        (`waiter` is woken when one frees up), or (None, seconds) until the
+        first failing proxy may be probed.
+        """
+        with self._lock:
+            full, waits = [], []
+            for route in self._candidates():
+                admitted = route.controller.try_acquire(waiter) if route.controller else 0
+                if admitted is FULL:
+                    full.append(route)
+                elif admitted:
+                    waits.append(admitted)
+                else:
+                    break
+            else:
+                # Stay registered with the full proxies too, whichever frees up first wakes the pair
+                return None, min(waits) if waits else FULL
+
+            for other in full:
+                other.controller.discard_waiter(waiter)
+            route.in_flight += 1
+            if self.routing == WEIGHTED:
+                for other in self.routes:
+                    other.current += other.weight
+                route.current -= self._total_weight
+            return route, 0.0
+
+    def release(self, route, latency=None, ok=True, error=False):
+        """Hand a send's slot back; returns the pairs to wake"""
+        with self._lock:
+            route.in_flight -= 1
+        if route.controller is None:
+            return ()
+        return route.controller.release(latency, ok, error)
+
+    def discard_waiter(self, waiter):
+        """Forget `waiter` everywhere; True if any proxy had it waiting"""
+        found = False
+        for route in self.routes:
+            if route.controller is not None and route.controller.discard_waiter(waiter):
+                found = True
+        return found
@@ -0,0 +1,94 @@
+# rate_limiter.py
+
+import os
+import time
+from threading import Lock
+
+DEFAULT_RATE_LIMIT = int(os.getenv("SMS_RATE_LIMIT_PER_MINUTE", "10"))
+
+
+class GCRALimiter:
+    """Generic cell rate algorithm on the monotonic clock.
+
+    Allows `limit` sends per `period` seconds with bursts of up to `burst`
+    sends. The default burst of 1 spaces sends `period / limit` apart, so no
+    window of `period` seconds holds more than `limit` sends; a larger burst
+    lets up to `limit + burst - 1` through in one window. The whole state is
+    one timestamp (the theoretical arrival time), so every check is constant
+    time and tells the caller exactly how long to wait.
+    """
+
+    def __init__(self, limit, period=60.0, burst=1):
+        self._lock = Lock()
+        self._tat = 0.0
+        self.configure(limit, period, burst)
+
+    def configure(self, limit, period=60.0, burst=1):
+        """Change the allowed rate without losing the current budget"""
+        if limit <= 0:
+            raise ValueError("Rate limit must be a positive number")
+        with self._lock:
+            self.limit = limit
+            self.period = period
+            self.burst = burst
+            self.interval = period / limit
+            self.tolerance = self.interval * (self.burst - 1)
+
+    def try_acquire(self, now=None):
+        """Take one send from the budget.
+
+        Returns 0 when the send is allowed, otherwise the number of seconds
+        until it will be.
+        """
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            tat = max(self._tat, now)
+            allow_at = tat - self.tolerance
+            if now < allow_at:
+                return allow_at - now
+            self._tat = tat + self.interval
+            return 0.0
+
+    def export_tat(self):
+        """The limiter state on the wall clock, so another process can continue from it"""
+        with self._lock:
+            return time.time() + (self._tat - time.monotonic())
+
+    def import_tat(self, tat):
+        """Continue from a state exported by export_tat, keeping the stricter of the two"""
+        with self._lock:
+            self._tat = max(self._tat, time.monotonic() + (tat - time.time()))
+
+    def next_available(self, now=None):
+        """Monotonic time at which the next send will be allowed"""
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            return max(self._tat - self.tolerance, now)
+
+
+class RateLimiterRegistry:
+    """One GCRALimiter per key, shared by every thread that sends for it"""
+
+    def __init__(self, default_limit=DEFAULT_RATE_LIMIT, period=60.0):
+        self.default_limit = default_limit
+        self.period = period
+        self._limiters = {}
+        self._lock = Lock()
+
+    def get(self, key, limit=None):
+        """Return the limiter for `key`, applying `limit` (per period) if given"""
+        limit = limit or self.default_limit
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = GCRALimiter(limit, self.period)
+                self._limiters[key] = limiter
+                return limiter
+
+        if limiter.limit != limit:
+            limiter.configure(limit, self.period)
+        return limiter
+
+    def discard(self, key):
+        with self._lock:
+            self._limiters.pop(key, None)
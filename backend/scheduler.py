@@ -0,0 +1,124 @@
+# scheduler.py
+
+import heapq
+import itertools
+import os
+import time
+from threading import Condition, Thread
+
+# Returned by a step when the pair waits for an in-flight send; the pair
+# submits itself again once that send completes.
+PARKED = object()
+
+
+class DispatchScheduler:
+    """Runs every active pair on one fixed pool of worker threads.
+
+    Pairs are not bound to a thread. A worker takes the pair with the highest
+    priority whose rate limit allows a send, runs one step of it and hands it
+    back with the time it may run again. Higher `priority` values go first;
+    pairs with the same priority take turns.
+
+    A pair is queued at most once: each queue entry carries a token and only
+    the latest token of a pair is run, so `wake` can move a waiting pair to
+    the front without searching the heaps.
+    """
+
+    def __init__(self, num_workers=None, app_context=None):
+        self.num_workers = num_workers or int(os.getenv("SMS_WORKER_COUNT", "8"))
+        self.app_context = app_context
+        self._ready = []    # (-priority, token, service)
+        self._waiting = []  # (eligible_at, token, service)
+        self._seq = itertools.count()
+        self._tokens = {}     # service -> token of its live queue entry
+        self._running = set()
+        self._woken = set()   # running services to run again as soon as their step returns
+        self._cond = Condition()
+        self._workers = []
+
+    def submit(self, service, eligible_at=None):
+        """Queue a pair to run at the monotonic time `eligible_at` (now if None)"""
+        self._ensure_workers()
+        with self._cond:
+            if service in self._running:
+                self._woken.add(service)
+                return
+            token = next(self._seq)
+            self._tokens[service] = token
+            if eligible_at is None or eligible_at <= time.monotonic():
+                heapq.heappush(self._ready, (-service.priority, token, service))
+            else:
+                heapq.heappush(self._waiting, (eligible_at, token, service))
+            self._cond.notify()
+
+    def wake(self, service):
+        """Run a queued or running pair again right away (e.g. to let it see a stop)"""
+        with self._cond:
+            if service in self._running:
+                self._woken.add(service)
+                return
+            if service not in self._tokens:
+                return  # parked, its in-flight sends submit it again
+        self.submit(service)
+
+    def pending(self):
+        """Number of pairs currently queued"""
+        with self._cond:
+            return len(self._tokens)
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        with self._cond:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = Thread(target=self._run, name=f"sms-dispatch-{i}")
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def _next(self):
+        """Block until a pair is eligible to run and return it"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._waiting and self._waiting[0][0] <= now:
+                    _, token, service = heapq.heappop(self._waiting)
+                    if self._tokens.get(service) == token:
+                        heapq.heappush(self._ready, (-service.priority, token, service))
+
+                while self._ready:
+                    _, token, service = heapq.heappop(self._ready)
+                    if self._tokens.get(service) == token:
+                        del self._tokens[service]
+                        self._running.add(service)
+                        return service
+
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                self._cond.wait(timeout)
+
+    def _run(self):
+        if self.app_context is not None:
+            with self.app_context():
+                self._loop()
+        else:
+            self._loop()
+
+    def _loop(self):
+        while True:
+            service = self._next()
+            try:
+                eligible_at = service.step()
+            except Exception as e:
+                print(f"Dispatch error for pair {service.pair_name}: {e}")
+                eligible_at = None
+
+            with self._cond:
+                self._running.discard(service)
+                woken = service in self._woken
+                self._woken.discard(service)
+            if woken and eligible_at is not None:
+                self.submit(service)
+            elif eligible_at is not None and eligible_at is not PARKED:
+                self.submit(service, eligible_at)
@@ -0,0 +1,111 @@
+# send_engine.py
+
+import asyncio
+import os
+import time
+from threading import Event, Lock, Thread
+
+from metrics import stage_seconds
+from program import SendSMS, SubmitSMS
+
+
+class SendEngine:
+    """Runs SendOtp/SumitOtp on one asyncio loop in a background thread.
+
+    Each proxy gets its own aiohttp session, so every send through the same
+    proxy reuses that proxy's keep-alive connection pool instead of opening a
+    new connection per number.
+    """
+
+    def __init__(self, connections_per_proxy=None, timeout=None):
+        self.connections_per_proxy = connections_per_proxy or int(
+            os.getenv("SMS_CONNECTIONS_PER_PROXY", "32")
+        )
+        self.timeout = timeout or float(os.getenv("SMS_SEND_TIMEOUT", "30"))
+        self.sends = 0
+        self._sessions = {}
+        self._loop = None
+        self._thread = None
+        self._lock = Lock()
+
+    def start(self):
+        """Start the event loop thread if it is not running yet"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            started = Event()
+            self._thread = Thread(target=self._run, args=(started,), name="sms-send-engine")
+            self._thread.daemon = True
+            self._thread.start()
+            started.wait()
+
+    def _run(self, started):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        started.set()
+        self._loop.run_forever()
+
+    def submit(self, phone_number, proxy, pair_name=""):
+        """Schedule one send and return a concurrent.futures.Future.
+
+        The future resolves to (send_result, submit_result).
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.send(phone_number, proxy, pair_name), self._loop)
+
+    def _session_for(self, proxy):
+        import aiohttp
+
+        session = self._sessions.get(proxy)
+        if session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.connections_per_proxy,
+                keepalive_timeout=60
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._sessions[proxy] = session
+        return session
+
+    async def send(self, phone_number, proxy, pair_name=""):
+        """Send the OTP to one number and submit the code when it was sent"""
+        session = self._session_for(proxy)
+        sms_sender = SendSMS(phone_number, proxy, session)
+        sms_submitter = SubmitSMS(proxy, session)
+        labels = (pair_name, proxy or "")
+
+        started = time.perf_counter()
+        send_result = await sms_sender.SendOtp()
+        sent = time.perf_counter()
+        stage_seconds.observe(("send",) + labels, sent - started)
+
+        if send_result:
+            trigger_id = "some_trigger_id"  # You'll need to implement how to get this
+            sms_code = "some_sms_code"     # You'll need to implement how to get this
+            submit_result = await sms_submitter.SumitOtp(trigger_id, sms_code)
+            stage_seconds.observe(("submit",) + labels, time.perf_counter() - sent)
+        else:
+            submit_result = False
+
+        self.sends += 1
+        return send_result, submit_result
+
+    def stop(self):
+        """Close every pooled session and stop the loop"""
+        with self._lock:
+            if self._loop is None:
+                return
+            future = asyncio.run_coroutine_threadsafe(self._close_sessions(), self._loop)
+            future.result(timeout=self.timeout)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+
+    async def _close_sessions(self):
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            await session.close()
+
@@ -1,32 +1,73 @@
 # service.py
 
-from program import SendSMS, SubmitSMS
-from models import SmsStats, MongoPair
-from config import db_SQL, db_mongo
-import pandas as pd
+from models import MongoPair
+from config import app
+from scheduler import DispatchScheduler, PARKED
+from send_engine import SendEngine
+from rate_limiter import RateLimiterRegistry
+from stats_writer import StatsAccumulator
+from number_reader import is_packed, iter_numbers, iter_packed
+from phone_numbers import format_number
+from checkpoints import ProgressCheckpoint
+from coordination import Coordinator
+from live_events import EventHub
+from metrics import classify_error, errors_total, registry, results_total, stage_seconds
+from proxy_control import FULL, ProxyControllerRegistry, ProxyPool
+from functools import partial
+import os
 import time
-from collections import defaultdict
-from datetime import datetime, timedelta
-from threading import Thread
+from threading import Event, Lock
 
 class SMSService:
     running_pairs = {}
-    send_times = defaultdict(list)
+    rate_limits = RateLimiterRegistry()
+    scheduler = DispatchScheduler(app_context=app.app_context)
+    send_engine = SendEngine()
+    stats = StatsAccumulator(app)
+    events = EventHub()
+    proxies = ProxyControllerRegistry(enabled=os.getenv("SMS_PROXY_CONTROL", "true").lower() == "true")
+    max_in_flight = int(os.getenv("SMS_PAIR_CONCURRENCY", "4"))
+    stop_timeout = float(os.getenv("SMS_STOP_TIMEOUT", "10"))
+    coordinator = None
+    _registry_lock = Lock()  # serializes starts and stops so a pair never runs twice
     
     def __init__(self, pair_name):
         self.pair_name = pair_name
-        self.should_stop = False
+        self.stopping = Event()
+        self.done = Event()  # set once the last in-flight send completed and stats were flushed
+        self.phone_numbers = None
+        self._exhausted = False
+        self._lock = Lock()
+        self._in_flight = 0
+        self._parked = False
         # Fetch pair data with error handling
         try:
-            pair_data = MongoPair.collection.find_one({"pair_name": pair_name})
+            pair_data = MongoPair.collection.find_one({"pair_name": pair_name}, MongoPair.PROJECTION)
             if not pair_data:
                 raise ValueError(f"Pair '{pair_name}' not found in MongoDB.")
         except Exception as e:
             raise RuntimeError(f"Failed to retrieve pair data for {pair_name}: {e}")
         
         self.proxy = pair_data.get("proxy")
+        self.proxy_pool = ProxyPool(MongoPair.proxy_pool(pair_data), self.proxies, pair_data.get("proxy_routing"))
+        self.max_in_flight = self.max_in_flight * len(self.proxy_pool.routes)
+        self.priority = int(pair_data.get("priority") or 0)
+        self.rate_limiter = self.rate_limits.get(pair_name, pair_data.get("rate_limit"))
         self.session_details = pair_data.get("session_details", {})
         self.numbers_file = self.session_details.get("numbers_file")
+        self.number_list_file = pair_data.get("number_list_file")
+        self.checkpoint = ProgressCheckpoint(
+            pair_name,
+            (self.number_list_file or {}).get("file_id") or self.numbers_file
+        )
+        self._dispatched = 0
+        self._sending = set()  # futures of the in-flight sends
+        self._blocked_since = None  # when the rate limit started holding the pair back
+        self.lease_deadline = None  # monotonic time our coordination lease may expire at
+    
+    @property
+    def should_stop(self):
+        return self.stopping.is_set()
     
     @classmethod
     def start_pair(cls, pair_name):
@@ -45,24 +86,40 @@ class SMSService:
         except Exception as e:
             return {"success": False, "message": f"Error updating MongoPair status: {e}"}
         
-        # Start the processing thread
-        service = cls(pair_name)
-        thread = Thread(target=service.process_numbers)
-        thread.daemon = True
-        thread.start()
-        
-        cls.running_pairs[pair_name] = service
+        if not cls.run_local(pair_name):
+            return {"success": True, "message": f"Pair {pair_name} is running on another instance"}
         return {"success": True, "message": f"Started processing pair {pair_name}"}
     
+    @classmethod
+    def start_coordination(cls):
+        """Start sharing pairs with the other instances (SMS_COORDINATION); safe to call more than once"""
+        if cls.coordinator:
+            cls.coordinator.start()
+    
+    @classmethod
+    def run_local(cls, pair_name):
+        """Run a pair on this instance; False if another instance owns it"""
+        # Pairs only run where their leases are renewed
+        cls.start_coordination()
+        with cls._registry_lock:
+            if pair_name in cls.running_pairs:
+                return True
+            service = cls(pair_name)
+            if cls.coordinator and not cls.coordinator.claim(service):
+                return False
+            
+            # Hand the pair to the shared dispatch workers
+            cls.running_pairs[pair_name] = service
+        cls.scheduler.submit(service)
+        cls.events.pair_state(pair_name, "running")
+        return True
+    
     @classmethod
     def stop_pair(cls, pair_name):
         """Stop processing for a pair"""
-        if pair_name not in cls.running_pairs:
+        if pair_name not in cls.running_pairs and not cls.coordinator:
             return {"success": False, "message": "Pair is not running"}
         
-        service = cls.running_pairs[pair_name]
-        service.should_stop = True
-        
         # Update pair status with error handling
         try:
             update_result = MongoPair.collection.update_one(
@@ -74,114 +131,258 @@ class SMSService:
         except Exception as e:
             return {"success": False, "message": f"Error updating MongoPair status: {e}"}
         
-        del cls.running_pairs[pair_name]
+        if not cls.stop_local(pair_name):
+            # The owning instance sees the status change on its next coordination round
+            return {"success": True, "message": f"Stop requested for pair {pair_name}"}
         return {"success": True, "message": f"Stopped processing pair {pair_name}"}
-
     
+    @classmethod
+    def stop_local(cls, pair_name, wait=True):
+        """Stop a pair on this instance without changing its status; False if it is not running here.
+        
+        With `wait`, returns once its in-flight sends have completed and its
+        stats are flushed, or after `stop_timeout` seconds when the sends
+        still outstanding are cancelled (and resent on the next start).
+        """
+        with cls._registry_lock:
+            service = cls.running_pairs.pop(pair_name, None)
+        if service is None:
+            return False
+        service.stop()
+        if wait and not service.done.wait(cls.stop_timeout):
+            service.cancel_sends()
+        return True
+
     @classmethod
     def restart_pair(cls, pair_name):
         """Restart processing for a pair"""
-        stop_result = cls.stop_pair(pair_name)
-        time.sleep(1)  # Give it a moment to stop
+        cls.stop_local(pair_name)
         start_result = cls.start_pair(pair_name)
         
         return {
             "success": start_result["success"],
-            "message": f"Restarted pair {pair_name}"
+            "message": f"Restarted pair {pair_name}" if start_result["success"] else start_result["message"]
         }
     
-    def can_send_sms(self):
-        """Check if we can send SMS based on rate limit (10 per minute)"""
-        current_time = datetime.now()
-        minute_ago = current_time - timedelta(minutes=1)
-        
-        # Clean up old entries
-        self.send_times[self.pair_name] = [
-            t for t in self.send_times[self.pair_name] 
-            if t > minute_ago
-        ]
-        
-        return len(self.send_times[self.pair_name]) < 10
+    def stop(self):
+        """Stop dispatching; a pair waiting on its rate limit or its proxy winds down right away"""
+        self.stopping.set()
+        if self.proxy_pool.discard_waiter(self):
+            self.scheduler.submit(self)
+        else:
+            self.scheduler.wake(self)
     
-    def process_numbers(self):
-        """Process phone numbers from Excel file"""
-        try:
-            # Read numbers from Excel file
-            df = pd.read_excel(self.numbers_file)
-            phone_numbers = df['phone_number'].tolist()  # Adjust column name as needed
-            
-            for phone_number in phone_numbers:
-                # Check if stop was requested
-                if self.should_stop:
-                    break
-                    
-                # Check rate limit
-                while not self.can_send_sms() and not self.should_stop:
-                    time.sleep(1)
-                
-                if self.should_stop:
-                    break
-                
-                # Process single SMS
-                self.process_single_sms(phone_number)
-                
-                # Update send times
-                self.send_times[self.pair_name].append(datetime.now())
-                
-        except Exception as e:
-            MongoPair.collection.update_one(
-                {"pair_name": self.pair_name},
-                {"$set": {"active_status": False}}
-            )
-            if self.pair_name in self.running_pairs:
-                del self.running_pairs[self.pair_name]
+    def cancel_sends(self):
+        """Give up on the sends still in flight; their numbers are not checkpointed"""
+        with self._lock:
+            sending = list(self._sending)
+        for future in sending:
+            future.cancel()
     
-    def process_single_sms(self, phone_number):
-        """Process a single SMS"""
+    def step(self):
+        """Dispatch the next SMS if the rate limit and concurrency allow it.
+        
+        Returns the monotonic time at which the pair should be stepped again,
+        PARKED while it waits for an in-flight send or a free slot on its
+        proxy, or None once the pair is finished or stopped.
+        """
+        held = None  # proxy slot to hand back if the step fails
         try:
-            sms_sender = SendSMS(phone_number, self.proxy)
-            sms_submitter = SubmitSMS()
+            if self.done.is_set():
+                return None  # woken again by a proxy it waited on before it finished
+            if self.should_stop or self._exhausted:
+                return self._finish_when_drained()
             
-            send_result = sms_sender.SendOtp()
+            if self.lease_deadline is not None and time.monotonic() >= self.lease_deadline:
+                # Renewals failed or the process was paused: another instance may own the pair by now
+                print(f"Lease of {self.pair_name} expired, stopping it on this instance")
+                self.stopping.set()
+                return self._finish_when_drained()
             
-            if send_result:
-                trigger_id = "some_trigger_id"  # You'll need to implement how to get this
-                sms_code = "some_sms_code"     # You'll need to implement how to get this
-                submit_result = sms_submitter.SumitOtp(trigger_id, sms_code)
-            else:
-                submit_result = False
+            if self.phone_numbers is None:
+                started = time.perf_counter()
+                self.phone_numbers = self._open_numbers()
+                stage_seconds.observe(("open_list", self.pair_name, ""), time.perf_counter() - started)
             
-            self._update_stats(send_result, submit_result)
+            with self._lock:
+                if self._in_flight >= self.max_in_flight:
+                    self._parked = True
+                    return PARKED
             
+            # Proxies may be at their concurrency limit or failing (then only probes get through)
+            route, wait = self.proxy_pool.acquire(self)
+            if route is None:
+                return PARKED if wait is FULL else time.monotonic() + wait
+            held = route
+            
+            wait = self.rate_limiter.try_acquire()
+            if wait:
+                held = None
+                self._release_proxy(route)
+                if self._blocked_since is None:
+                    self._blocked_since = time.perf_counter()
+                return time.monotonic() + wait
+            if self._blocked_since is not None:
+                stage_seconds.observe(("rate_limit_wait", self.pair_name, ""), time.perf_counter() - self._blocked_since)
+                self._blocked_since = None
+            
+            started = time.perf_counter()
+            phone_number = next(self.phone_numbers, None)
+            stage_seconds.observe(("read", self.pair_name, ""), time.perf_counter() - started)
+            if phone_number is None:
+                held = None
+                self._release_proxy(route)
+                self._exhausted = True
+                return self._finish_when_drained()
+            
+            # Process single SMS; its completion hands the proxy slot back
+            held = None
+            self.process_single_sms(phone_number, route)
+            self.checkpoint.save_if_due()
+            return self.rate_limiter.next_available()
+                
         except Exception as e:
-            self._update_stats(False, False)
+            print(f"Stopping pair {self.pair_name} after an error: {e}")
+            errors_total.inc((self.pair_name, self.proxy or "", "pair_error"))
+            self.stopping.set()
+            try:
+                if held is not None:
+                    self._release_proxy(held)
+                MongoPair.collection.update_one(
+                    {"pair_name": self.pair_name},
+                    {"$set": {"active_status": False}}
+                )
+            except Exception as e:
+                print(f"Failed to mark {self.pair_name} inactive: {e}")
+            # Always unregister the pair and set `done`, or it could never be started or stopped again
+            return self._finish_when_drained()
+    
+    def _open_numbers(self):
+        """Stream phone numbers from where the last checkpoint left off"""
+        offset = self.checkpoint.load()
+        if is_packed(self._list_filename()):
+            # Packed lists are never modified in place, so seek straight to the offset
+            numbers = map(format_number, iter_packed(self._open_list(), start=offset))
+        else:
+            numbers = iter_numbers(self._open_list(), self._list_filename())
+            if offset and not self.checkpoint.skip(numbers):
+                # The list changed since the checkpoint was taken, start over
+                numbers = iter_numbers(self._open_list(), self._list_filename())
+        self._dispatched = self.checkpoint.offset
+        return numbers
+    
+    def _list_filename(self):
+        if self.number_list_file:
+            return self.number_list_file.get("filename", "")
+        return self.numbers_file or ""
     
-    def _update_stats(self, send_success, submit_success):
-        """Update statistics for a single SMS"""
+    def _open_list(self):
+        """Open the uploaded list (or a file on disk) as a binary stream"""
+        if self.number_list_file:
+            return MongoPair.open_file(self.pair_name, self.number_list_file)
+        if self.numbers_file:
+            return open(self.numbers_file, "rb")
+        raise ValueError(f"Pair '{self.pair_name}' has no number list")
+    
+    def _finish_when_drained(self):
+        """Unregister the pair once every in-flight send has completed"""
+        with self._lock:
+            if self._in_flight:
+                self._parked = True
+                return PARKED
+        
+        self.stats.flush()
+        completed = self._exhausted and not self.should_stop
         try:
-            stats = SmsStats.query.filter_by(pair_name=self.pair_name).first()
-            
-            if not stats:
-                stats = SmsStats(
-                    pair_name=self.pair_name,
-                    total_sms_sent=0,
-                    total_sms_failed=0,
-                    total_rate_of_success=0,
-                    total_rate_of_failure=0
+            if self.phone_numbers is not None:
+                self.checkpoint.save(completed=completed)
+            if completed:
+                # Keep the coordinator from picking a finished pair up again
+                MongoPair.collection.update_one(
+                    {"pair_name": self.pair_name},
+                    {"$set": {"active_status": False}}
                 )
-                db_SQL.session.add(stats)
-            
-            if send_success:
-                stats.total_sms_sent += 1
+        except Exception as e:
+            print(f"Failed to save progress of {self.pair_name}: {e}")
+        self._unregister()
+        if self.pair_name not in self.running_pairs:
+            self.events.pair_state(self.pair_name, "finished" if completed else "stopped")
+            if self.coordinator:
+                self.coordinator.release(self.pair_name, self.rate_limiter)
+        self.done.set()
+        return None
+    
+    def _unregister(self):
+        """Drop this service from the registry unless it was already replaced"""
+        with self._registry_lock:
+            if self.running_pairs.get(self.pair_name) is self:
+                del self.running_pairs[self.pair_name]
+    
+    def process_single_sms(self, phone_number, route):
+        """Hand a single SMS to the send engine through the proxy `route` without waiting for it"""
+        with self._lock:
+            self._in_flight += 1
+        index = self._dispatched
+        self._dispatched += 1
+        
+        future = self.send_engine.submit(phone_number, route.proxy, self.pair_name)
+        with self._lock:
+            self._sending.add(future)
+        future.add_done_callback(partial(self._on_sent, index, phone_number, route, time.perf_counter()))
+    
+    def _release_proxy(self, route, latency=None, ok=True, error=False):
+        """Hand a proxy slot back and wake the pairs waiting for one"""
+        for waiter in self.proxy_pool.release(route, latency, ok, error):
+            self.scheduler.submit(waiter)
+    
+    def _on_sent(self, index, phone_number, route, started, future):
+        """Count the result of a send and wake the pair if it was parked"""
+        labels = (self.pair_name, route.proxy or "")
+        latency = time.perf_counter() - started
+        if future.cancelled():
+            errors_total.inc(labels + ("cancelled",))
+            self._release_proxy(route)
+        else:
+            error = False
+            try:
+                send_result, submit_result = future.result()
+            except Exception as e:
+                send_result = submit_result = False
+                error = True
+                errors_total.inc(labels + (classify_error(e),))
             else:
-                stats.total_sms_failed += 1
-            
-            total_attempts = stats.total_sms_sent + stats.total_sms_failed
-            stats.total_rate_of_success = (stats.total_sms_sent * 100) // total_attempts
-            stats.total_rate_of_failure = (stats.total_sms_failed * 100) // total_attempts
-            
-            db_SQL.session.commit()
+                if not send_result:
+                    errors_total.inc(labels + ("gateway_rejected",))
+                elif not submit_result:
+                    errors_total.inc(labels + ("submit_rejected",))
             
-        except Exception as e:
-            db_SQL.session.rollback()
-            raise
\ No newline at end of file
+            self._release_proxy(route, latency, send_result, error)
+            stage_seconds.observe(("sms",) + labels, latency)
+            results_total.inc(labels + ("sent" if send_result else "failed",))
+            # Stored and published in one step, so /events snapshots count it exactly once
+            self.events.count(self.pair_name, send_result, record=self.stats.record)
+            self.checkpoint.complete(index, phone_number)
+        
+        with self._lock:
+            self._sending.discard(future)
+            self._in_flight -= 1
+            wake = self._parked
+            self._parked = False
+        
+        if wake:
+            self.scheduler.submit(self)
+
+
+for field, kind, documentation in (
+    ("limit", None, "Adaptive concurrency limit of each proxy"),
+    ("in_flight", None, "Sends in flight through each proxy"),
+    ("breaker_open", None, "1 while the circuit breaker of a proxy is open"),
+    ("breaker_opened", "counter", "Times the circuit breaker of a proxy opened"),
+):
+    registry.gauge(
+        f"sms_proxy_{field}" + ("_total" if kind == "counter" else ""), documentation, ("proxy",),
+        partial(SMSService.proxies.sample, field), kind
+    )
+
+if os.getenv("SMS_COORDINATION", "false").lower() == "true":
+    SMSService.coordinator = Coordinator(SMSService, MongoPair.collection)
@@ -0,0 +1,306 @@
+# stats_writer.py
+
+import atexit
+import os
+import time
+from datetime import datetime, timedelta
+from threading import Event, Lock, RLock, Thread
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from config import db_SQL
+from metrics import stage_seconds
+from models import GRANULARITIES, SmsStats, SmsStatsBucket
+
+# How long buckets of each granularity are kept, in seconds
+RETENTION = {
+    "minute": int(os.getenv("SMS_STATS_MINUTE_RETENTION_HOURS", "48")) * 3600,
+    "hour": int(os.getenv("SMS_STATS_HOUR_RETENTION_DAYS", "90")) * 86400,
+    "day": int(os.getenv("SMS_STATS_DAY_RETENTION_DAYS", "730")) * 86400,
+}
+PRUNE_INTERVAL = 600
+
+
+class StatsAccumulator:
+    """Collects per-pair counter deltas in memory and writes them in batches.
+
+    A background thread flushes every `interval` seconds, or sooner once
+    `max_pending` results are waiting. A flush costs one SELECT, one bulk
+    INSERT for new pairs and one executemany UPDATE that adds the deltas in
+    SQL, all in a single transaction, no matter how many SMS it covers.
+
+    The same flush adds the counts to the pair's minute, hour and day buckets
+    in sms_stats_buckets, so windowed stats are read from a handful of
+    pre-aggregated rows. Buckets older than their retention are pruned.
+    """
+
+    def __init__(self, app, interval=None, max_pending=None):
+        self.app = app
+        self.interval = interval or float(os.getenv("SMS_STATS_FLUSH_INTERVAL", "1"))
+        self.max_pending = max_pending or int(os.getenv("SMS_STATS_FLUSH_SIZE", "500"))
+        self._deltas = {}  # pair_name -> [sent, failed]
+        self._minutes = {}  # (pair_name, minute) -> [sent, failed]
+        self._pending = 0
+        self._pruned_at = 0
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._thread = None
+        self.aggregate = AggregateSnapshot()
+        atexit.register(self.flush)
+
+    def record(self, pair_name, success):
+        """Count one SMS for the pair"""
+        with self._lock:
+            counts = self._deltas.get(pair_name)
+            if counts is None:
+                counts = self._deltas[pair_name] = [0, 0]
+            counts[0 if success else 1] += 1
+            key = (pair_name, int(time.time() // 60))
+            counts = self._minutes.get(key)
+            if counts is None:
+                counts = self._minutes[key] = [0, 0]
+            counts[0 if success else 1] += 1
+            self._pending += 1
+            full = self._pending >= self.max_pending
+
+        if self._thread is None:
+            self._start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self, pair_name):
+        """Counts recorded for the pair that are not written yet, as (sent, failed)"""
+        with self._lock:
+            counts = self._deltas.get(pair_name)
+            return tuple(counts) if counts else (0, 0)
+
+    def pending_totals(self):
+        """Counts of every pair that are not written yet, as (sent, failed)"""
+        with self._lock:
+            return (
+                sum(sent for sent, _ in self._deltas.values()),
+                sum(failed for _, failed in self._deltas.values())
+            )
+
+    def hold_flushes(self):
+        """Context manager that keeps flushes from moving pending counts into the aggregate"""
+        return self._flush_lock
+
+    def discard(self, pair_name):
+        """Drop unwritten counts of a pair, e.g. when its stats are deleted"""
+        with self._lock:
+            counts = self._deltas.pop(pair_name, None)
+            if counts:
+                self._pending -= sum(counts)
+            for key in [key for key in self._minutes if key[0] == pair_name]:
+                del self._minutes[key]
+
+    def flush(self):
+        """Write every pending delta to the database"""
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+                minutes, self._minutes = self._minutes, {}
+                self._pending = 0
+            if not deltas:
+                return
+
+            started = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    self._write(deltas, minutes)
+                stage_seconds.observe(("stats_flush", "", ""), time.perf_counter() - started)
+            except Exception as e:
+                print(f"Stats flush failed, keeping counts for retry: {e}")
+                self._merge_back(deltas, minutes)
+
+    def _write(self, deltas, minutes):
+        table = SmsStats.__table__
+        session = db_SQL.session
+        try:
+            existing = set(session.execute(
+                select(table.c.pair_name).where(table.c.pair_name.in_(deltas))
+            ).scalars())
+
+            new_rows = [
+                {
+                    "pair_name": pair_name,
+                    "total_sms_sent": sent,
+                    "total_sms_failed": failed,
+                    "total_rate_of_success": 0,
+                    "total_rate_of_failure": 0
+                }
+                for pair_name, (sent, failed) in deltas.items()
+                if pair_name not in existing
+            ]
+            if new_rows:
+                session.execute(insert(table), new_rows)
+
+            changes = [
+                {"b_pair_name": pair_name, "b_sent": sent, "b_failed": failed}
+                for pair_name, (sent, failed) in deltas.items()
+                if pair_name in existing
+            ]
+            if changes:
+                session.execute(
+                    update(table)
+                    .where(table.c.pair_name == bindparam("b_pair_name"))
+                    .values(
+                        total_sms_sent=table.c.total_sms_sent + bindparam("b_sent"),
+                        total_sms_failed=table.c.total_sms_failed + bindparam("b_failed")
+                    ),
+                    changes
+                )
+
+            self._write_buckets(session, minutes)
+            with self.aggregate.lock:
+                session.commit()
+                self.aggregate.add(
+                    sum(sent for sent, _ in deltas.values()),
+                    sum(failed for _, failed in deltas.values()),
+                    len(new_rows)
+                )
+        except Exception:
+            session.rollback()
+            raise
+
+    def _write_buckets(self, session, minutes):
+        """Add the per-minute counts to every granularity's buckets"""
+        buckets = {}
+        for (pair_name, minute), (sent, failed) in minutes.items():
+            for granularity, size in GRANULARITIES.items():
+                start = minute * 60 // size * size
+                counts = buckets.setdefault((pair_name, granularity, start), [0, 0])
+                counts[0] += sent
+                counts[1] += failed
+
+        rows = [
+            {
+                "pair_name": pair_name,
+                "granularity": granularity,
+                "bucket_start": datetime.utcfromtimestamp(start),
+                "total_sms_sent": sent,
+                "total_sms_failed": failed
+            }
+            for (pair_name, granularity, start), (sent, failed) in buckets.items()
+        ]
+        if rows:
+            session.execute(_increment_buckets(session), rows)
+
+    def prune(self):
+        """Delete buckets older than their granularity's retention"""
+        table = SmsStatsBucket.__table__
+        now = datetime.utcnow()
+        with self.app.app_context():
+            session = db_SQL.session
+            try:
+                for granularity, seconds in RETENTION.items():
+                    session.execute(
+                        delete(table).where(
+                            table.c.granularity == granularity,
+                            table.c.bucket_start < now - timedelta(seconds=seconds)
+                        )
+                    )
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                print(f"Stats bucket pruning failed: {e}")
+
+    def _merge_back(self, deltas, minutes):
+        with self._lock:
+            for pair_name, (sent, failed) in deltas.items():
+                counts = self._deltas.setdefault(pair_name, [0, 0])
+                counts[0] += sent
+                counts[1] += failed
+                self._pending += sent + failed
+            for key, (sent, failed) in minutes.items():
+                counts = self._minutes.setdefault(key, [0, 0])
+                counts[0] += sent
+                counts[1] += failed
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = Thread(target=self._run, name="sms-stats-writer")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+            if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+                self._pruned_at = time.monotonic()
+                self.prune()
+
+
+class AggregateSnapshot:
+    """In-process cache of the totals across all pairs.
+
+    Reloaded from the database at most once per `ttl` seconds and kept
+    current in between by the stats flushes, so serving it is a dict copy.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or float(os.getenv("SMS_AGGREGATE_TTL", "5"))
+        self.lock = RLock()
+        self._cached = None  # (loaded_at, {"total_pairs", "total_sms_sent", "total_sms_failed"})
+
+    def get(self, load):
+        """Return the totals, calling `load()` when the snapshot is stale"""
+        cached = self._cached
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return dict(cached[1])
+
+        with self.lock:
+            cached = self._cached
+            if cached is None or time.monotonic() - cached[0] >= self.ttl:
+                cached = self._cached = (time.monotonic(), load())
+            return dict(cached[1])
+
+    def add(self, sent, failed, new_pairs=0):
+        """Apply counts that were just committed"""
+        with self.lock:
+            if self._cached is None:
+                return
+            loaded_at, totals = self._cached
+            totals = dict(totals)
+            totals["total_pairs"] += new_pairs
+            totals["total_sms_sent"] += sent
+            totals["total_sms_failed"] += failed
+            self._cached = (loaded_at, totals)
+
+    def invalidate(self):
+        with self.lock:
+            self._cached = None
+
+
+def _increment_buckets(session):
+    """INSERT of bucket rows that adds to the counts of rows that already exist"""
+    table = SmsStatsBucket.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+        statement = mysql_insert(table)
+        return statement.on_duplicate_key_update(
+            total_sms_sent=table.c.total_sms_sent + statement.inserted.total_sms_sent,
+            total_sms_failed=table.c.total_sms_failed + statement.inserted.total_sms_failed
+        )
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    statement = dialect_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=["pair_name", "granularity", "bucket_start"],
+        set_={
+            "total_sms_sent": table.c.total_sms_sent + statement.excluded.total_sms_sent,
+            "total_sms_failed": table.c.total_sms_failed + statement.excluded.total_sms_failed
+        }
+    )
@@ -0,0 +1,59 @@
+# token_cache.py
+
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class TokenCache:
+    """Bounded LRU cache of verified JWT claims.
+
+    A hit skips signature verification. Entries expire at the token's `exp`
+    claim, and revoked tokens are remembered until they would have expired
+    anyway so they can never be served from the cache or decoded again.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize or int(os.getenv("JWT_CACHE_SIZE", "1024"))
+        self._entries = OrderedDict()  # token -> (expires_at, claims)
+        self._revoked = {}  # token -> expires_at
+        self._lock = Lock()
+
+    def get(self, token):
+        """Claims of a cached, unexpired token, or None"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def put(self, token, claims):
+        """Remember the claims of a token that was just verified"""
+        expires_at = claims.get("exp")
+        if expires_at is None:
+            return
+        with self._lock:
+            if token in self._revoked:
+                return
+            self._entries[token] = (expires_at, claims)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def revoke(self, token, expires_at):
+        """Reject the token from now on"""
+        with self._lock:
+            self._entries.pop(token, None)
+            now = time.time()
+            if len(self._revoked) >= self.maxsize:
+                self._revoked = {t: exp for t, exp in self._revoked.items() if exp > now}
+            self._revoked[token] = expires_at
+
+    def is_revoked(self, token):
+        with self._lock:
+            return token in self._revoked
@@ -58,7 +58,12 @@ const DisplayAndaddPairs = () => {
 
             const formDataToSend = new FormData();
             formDataToSend.append('pair_name', formData.pairName);
-            formDataToSend.append('proxy', formData.proxy);
+            // Several comma separated proxies make a pool the pair spreads its numbers over
+            const proxies = formData.proxy.split(',').map((proxy) => proxy.trim()).filter(Boolean);
+            formDataToSend.append('proxy', proxies[0] || '');
+            if (proxies.length > 1) {
+                formDataToSend.append('proxies', proxies.join(','));
+            }
             if (formData.numberList) {
                 formDataToSend.append('number_list', formData.numberList);
             }
@@ -181,7 +186,7 @@ const DisplayAndaddPairs = () => {
                                     value={formData.proxy}
                                     onChange={handleInputChange}
                                     className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-green-500 focus:border-transparent"
-                                    placeholder="Enter proxy"
+                                    placeholder="Enter proxy (comma separated for a pool)"
                                 />
                             </div>
 
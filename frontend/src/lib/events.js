@@ -0,0 +1,35 @@
+import axios from "axios";
+
+const API = "http://127.0.0.1:5000";
+
+// Opens the live stats stream (GET /events) and returns a function that closes it.
+// EventSource cannot send headers, so each connection first trades the login token
+// for a short-lived stream token; a dropped stream reconnects with a new one and
+// starts again from a fresh snapshot.
+export function openEventStream(token, listeners, onFailed) {
+  let events = null;
+  let closed = false;
+
+  const connect = async () => {
+    try {
+      const response = await axios.post(`${API}/events/token`, null, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (closed) return;
+      events = new EventSource(`${API}/events?token=${response.data.token}`);
+      Object.entries(listeners).forEach(([name, listener]) => events.addEventListener(name, listener));
+      events.onerror = () => {
+        events.close();
+        if (!closed) setTimeout(connect, 1000);
+      };
+    } catch (error) {
+      if (!closed && onFailed) onFailed(error);
+    }
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    if (events) events.close();
+  };
+}